@@ -1,76 +1,190 @@
 from flask import Flask, render_template, session, redirect, url_for, jsonify, request
-import subprocess
 import re
-import toml
 from stream_manager import StreamManager
+from station_catalog import get_catalog, DEFAULT_PAGE_SIZE, PRESET_KEYS
+from config_writer import ConfigWriter
+from network_state import get_network_state
+from connectivity import get_prober
+from player_events import EVENTS_PORT
+from stream_relay import RELAY_PORT
+from metrics import instrument_flask, timed_run
+from web_server import slow_route
+from station_health import get_health_checker
 import json
 import time
 
-def create_app():
-    """Create and configure the Flask app."""
+def create_app(player=None):
+    """Create and configure the Flask app.
+
+    Pass the process's StreamManager so the web UI and the hardware buttons
+    drive the same players.
+    """
     app = Flask(__name__, static_folder='templates/static')
     app.secret_key = 'your_secret_key_here'
 
-    player = StreamManager(50)
+    catalog = get_catalog()
+    if player is None:
+        player = StreamManager(50, catalog=catalog)
+    config_writer = ConfigWriter(catalog)
+    health = get_health_checker(catalog)
+    instrument_flask(app)
 
-    register_core_routes(app, player)
+    register_core_routes(app, player, catalog, config_writer, health)
 
     return app
 
-def register_core_routes(app, player):
+def _health_summary(result):
+    if result is None:
+        return None
+    return {'ok': result['ok'], 'latency_ms': result['latency_ms'], 'bitrate': result['bitrate']}
+
+def register_core_routes(app, player, catalog, config_writer, health):
     @app.route('/')
     def index():
         """Render the index page with configuration links."""
-        config = toml.load('config.toml')
-        links = config.get('links', [])
-        link1 = config.get('link1')
-        link2 = config.get('link2')
-        link3 = config.get('link3')
+        channel1_name = catalog.preset_name('link1')
+        channel2_name = catalog.preset_name('link2')
+        channel3_name = catalog.preset_name('link3')
 
-        link_to_channel_mapping = {link['url']: link['name'] for link in links}
-    
-        channel1_name = link_to_channel_mapping.get(link1, "Unknown Channel")
-        channel2_name = link_to_channel_mapping.get(link2, "Unknown Channel")
-        channel3_name = link_to_channel_mapping.get(link3, "Unknown Channel")
-
-        return render_template('index.html', link1=channel1_name, link2=channel2_name, link3=channel3_name)
+        return render_template('index.html', link1=channel1_name, link2=channel2_name, link3=channel3_name,
+                               timeshift=bool(player.timeshift_minutes), events_port=EVENTS_PORT)
 
     @app.route('/stream-select', methods=['GET'])
     def select_link():
         channel = request.args.get('channel')  # Get channel (link1, link2, etc.) from the query params
-        # Load the config file
-        config_data = toml.load('config.toml')
-
         # Extract active links
-        active_links = {
-            'link1': config_data['link1'],
-            'link2': config_data['link2'],
-            'link3': config_data['link3']
-        }
+        active_links = catalog.presets
+
+        # Spare links are loaded page by page from /api/stations
+        return render_template('stream_select.html', channel=channel, active_links=active_links,
+                               events_port=EVENTS_PORT)
+
+    @app.route('/api/stations')
+    def list_stations():
+        """Return one page of stations matching the search parameters.
+
+        health=hide leaves out stations whose last health check failed and
+        health=rank orders each page by health (reachable and fastest first).
+        """
+        try:
+            cursor = int(request.args.get('cursor', 0))
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'cursor and limit must be integers'}), 400
+        health_mode = request.args.get('health', '')
+        if health_mode not in ('', 'hide', 'rank'):
+            return jsonify({'error': 'health must be hide or rank'}), 400
 
-        # Extract spare links
-        spare_links = config_data['links']
+        stations, next_cursor = catalog.index.search(
+            query=request.args.get('q', ''),
+            prefix=request.args.get('prefix', ''),
+            country=request.args.get('country', ''),
+            location=request.args.get('location', ''),
+            cursor=cursor,
+            limit=limit,
+            exclude=(lambda link: health.is_dead(link['url'])) if health_mode == 'hide' else None
+        )
+        if health_mode == 'rank':
+            stations = sorted(stations, key=lambda link: health.rank(link['url']))
+        return jsonify({
+            'stations': [
+                {
+                    'name': link.get('name', ''),
+                    'url': link['url'],
+                    'country': link.get('country', ''),
+                    'location': link.get('location', ''),
+                    'health': _health_summary(health.get(link['url']))
+                }
+                for link in stations
+            ],
+            'next_cursor': next_cursor
+        })
 
-        return render_template('stream_select.html', channel=channel, active_links=active_links, spare_links=spare_links)
+    @app.route('/api/station-health')
+    def station_health():
+        """Return totals from the station health checker."""
+        return jsonify(health.summary())
+
+    @app.route('/listen')
+    def listen():
+        """Send LAN listeners to the relay, which shares one upstream connection between them."""
+        return redirect(f"http://{request.host.split(':')[0]}:{RELAY_PORT}/listen")
 
     @app.route('/update-stream', methods=['POST'])
     def update_link():
         channel = request.form['channel']  # e.g., link1, link2, link3
         selected_link = request.form['selected_link']  # The new URL selected by the user
 
-        # Load the config file
-        config_data = toml.load('config.toml')
-
-        # Update the selected link
-        config_data[channel] = selected_link
+        if channel not in PRESET_KEYS:
+            return jsonify({'success': False, 'error': f'Unknown channel: {channel}'}), 400
 
-        # Write the changes back to config.toml
-        with open('config.toml', 'w') as configfile:
-            toml.dump(config_data, configfile)
+        # Update the preset in memory; the writer merges quick changes into one atomic write
+        config_writer.set_preset(channel, selected_link)
+        player.resolve_presets()
 
         print(f"Channel: {channel}, Selected Link: {selected_link}")
         return jsonify({'success': True})  # Redirect back to the main page
 
+    @app.route('/timeshift/<action>', methods=['POST'])
+    def timeshift(action):
+        """Pause, resume, jump back or return to live on the timeshifted preset stream."""
+        if action == 'back':
+            try:
+                seconds = float(request.form.get('seconds', 30))
+            except ValueError:
+                return jsonify({'success': False, 'error': 'seconds must be a number'}), 400
+            done = player.jump_back(seconds)
+        elif action in ('pause', 'resume', 'live'):
+            done = {'pause': player.pause_stream, 'resume': player.resume_stream, 'live': player.go_live}[action]()
+        else:
+            return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 404
+        if not done:
+            return jsonify({'success': False, 'error': 'No timeshifted stream to control'}), 409
+        return jsonify({'success': True, 'state': player.player_state.snapshot()})
+
+    @app.route('/stream-status')
+    def stream_status():
+        """Return a snapshot of the player state for clients without Server-Sent Events."""
+        return jsonify(player.player_state.snapshot())
+
+    now_playing_cache = {}
+
+    @app.route('/api/now-playing')
+    def now_playing():
+        """Return the playing station, its title and recent tracks (or those of ?url=).
+
+        The body is rebuilt only when the player state or the track history
+        changes; pollers sending If-None-Match get 304 in between. Title changes
+        are also pushed over the Server-Sent Events stream.
+        """
+        state = player.player_state.snapshot()
+        url = request.args.get('url') or state['url']
+        etag = f"{state['version']}-{player.history.version}-{hash(url)}"
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': f'"{etag}"'}
+        cached_etag, body = now_playing_cache.get('entry', (None, None))
+        if cached_etag != etag:
+            playing = url is not None and url == state['url']
+            body = json.dumps({
+                'url': url,
+                'name': catalog.name_for_url(url) if url else None,
+                'playing': playing,
+                'state': state['state'] if playing else 'stopped',
+                'paused': playing and state['paused'],
+                # While timeshifted the player's title trails the live one in the history
+                'title': state['title'] if playing else player.history.current(url),
+                'history': player.history.history(url)
+            })
+            now_playing_cache['entry'] = (etag, body)
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    @app.route('/api/stream-health')
+    def stream_health():
+        """Return the stream supervisor's state and per-station failure counters."""
+        return jsonify(player.supervisor.stats())
+
     @app.route('/play-stream', methods=['POST'])
     def play_stream():
         url_stream = request.form['url']  # Get the channel from the request
@@ -82,7 +196,7 @@ def register_core_routes(app, player):
         if len(password) > 0:
           connection_command.append("password")
           connection_command.append(password)
-        result = subprocess.run(connection_command, capture_output=True)
+        result = timed_run(connection_command, capture_output=True)
         if result.stderr:
             return "Error: failed to connect to wifi network: <i>%s</i>" % result.stderr.decode()
         elif result.stdout:
@@ -92,9 +206,8 @@ def register_core_routes(app, player):
     @app.route('/get_wifi_ssid')
     def get_wifi_ssid():
         try:
-            # Check the Wi-Fi connection by using iwgetid
-            result = subprocess.run(['iwgetid', '-r'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            ssid = result.stdout.decode().strip()
+            # Read the SSID cached from NetworkManager events
+            ssid = get_network_state().ssid
             if ssid:
                 return jsonify({'ssid': ssid})
             else:
@@ -103,22 +216,23 @@ def register_core_routes(app, player):
             return jsonify({'error': str(e)})
     
     @app.route('/check_internet_connection')
+    @slow_route(timeout=5)
     def check_internet_connection():
         try:
-            result = subprocess.run(['ping', '-c', '1', '8.8.8.8'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if result.returncode == 0:
-                return jsonify({'connected': True})
-            else:
-                return jsonify({'connected': False})
+            # Socket-level probe, cached for a few seconds and shared by concurrent requests
+            prober = get_prober()
+            prober.check()
+            return jsonify(prober.snapshot())
         except Exception as e:
             return jsonify({'connected': False, 'error': str(e)})
 
     @app.route('/wifi-debug')
+    @slow_route(timeout=15)
     def wifi_debug():
         try:
             # Get current connection info
-            iw_info = subprocess.check_output(["iwconfig", "wlan0"], text=True)
-            nm_status = subprocess.check_output(["nmcli", "device", "status"], text=True)
+            iw_info = timed_run(["iwconfig", "wlan0"], capture_output=True, text=True, check=True).stdout
+            nm_status = timed_run(["nmcli", "device", "status"], capture_output=True, text=True, check=True).stdout
             
             # Parse current connection
             current = {}
@@ -160,7 +274,7 @@ def register_core_routes(app, player):
 
     def check_radio_status():
         try:
-            result = subprocess.run(['systemctl', 'is-active', 'radio'], 
+            result = timed_run(['systemctl', 'is-active', 'radio'], 
                                   capture_output=True, 
                                   text=True)
             if result.stdout.strip() == 'active':
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import vlc
+
+VLC_ARGS = ('--aout=alsa', '--alsa-audio-device=plughw:2,0')  # Use Headphones device
+PLAYER_NAMES = ('main', 'preview', 'cue')
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class ScheduledCall:
+    """Handle for a call_later() timer."""
+
+    __slots__ = ('when', 'func', 'args', 'cancelled')
+
+    def __init__(self, when, func, args):
+        self.when = when
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the call from running; harmless if it already ran."""
+        self.cancelled = True
+
+
+class AudioEngine:
+    """Owns the single VLC instance and its players and runs player commands one at a time.
+
+    Flask routes, GPIO handlers and sound cues all submit commands here, so two
+    callers can never drive the players concurrently. Timers set with
+    call_later() live in a heap on the same thread, so they need no thread of
+    their own and run in order with the commands.
+    """
+
+    def __init__(self, vlc_args=VLC_ARGS):
+        self.instance = vlc.Instance(*vlc_args)
+        self.players = {name: self.instance.media_player_new() for name in PLAYER_NAMES}
+        self._commands = queue.Queue()
+        self._timers = []  # Heap of (when, sequence, ScheduledCall), only touched by the engine thread
+        self._timer_sequence = itertools.count()
+        self._thread = threading.Thread(target=self._run, name='audio-engine', daemon=True)
+        self._thread.start()
+
+    def player(self, name):
+        """Return one of the engine's named players (main, preview or cue)."""
+        return self.players[name]
+
+    def new_player(self):
+        """Create an extra player on the shared instance (e.g. a standby player)."""
+        return self.instance.media_player_new()
+
+    def media(self, mrl):
+        """Create a media object on the shared instance."""
+        return self.instance.media_new(mrl)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a command for the engine thread and return a Future for its result."""
+        future = Future()
+        self._commands.put((future, func, args, kwargs))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Run a command on the engine thread and wait for its result."""
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    def call_later(self, delay, func, *args):
+        """Run func(*args) on the engine thread after delay seconds; returns a ScheduledCall to cancel it."""
+        scheduled = ScheduledCall(time.monotonic() + delay, func, args)
+        self.submit(self._add_timer, scheduled)
+        return scheduled
+
+    def _add_timer(self, scheduled):
+        heapq.heappush(self._timers, (scheduled.when, next(self._timer_sequence), scheduled))
+
+    def _run_due_timers(self):
+        """Run the timers that are due; returns the seconds until the next one, or None."""
+        while self._timers:
+            when, _, scheduled = self._timers[0]
+            remaining = when - time.monotonic()
+            if remaining > 0 and not scheduled.cancelled:
+                return remaining
+            heapq.heappop(self._timers)
+            if not scheduled.cancelled:
+                scheduled.cancelled = True
+                try:
+                    scheduled.func(*scheduled.args)
+                except Exception as e:
+                    print(f"Audio engine timer failed: {e}")
+        return None
+
+    def _run(self):
+        while True:
+            try:
+                future, func, args, kwargs = self._commands.get(timeout=self._run_due_timers())
+            except queue.Empty:
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                print(f"Audio engine command failed: {e}")
+                future.set_exception(e)
+
+
+def get_engine():
+    """Return the process-wide audio engine, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AudioEngine()
+        return _engine
@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+def _uptime():
+    try:
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BootSequence:
+    """Runs boot stages on their own threads as soon as the stages they depend on finish.
+
+    Each stage is a function taking the results of its dependencies as keyword
+    arguments. Start and duration of every stage are logged relative to when
+    the sequence was created, and mark() logs milestones such as first audio.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.timings = {}
+        self.milestones = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, func, after=()):
+        """Register a stage; returns the Future for its result."""
+        future = Future()
+        self._stages[name] = (func, tuple(after), future)
+        return future
+
+    def run(self):
+        """Start every stage and return immediately."""
+        for name in self._stages:
+            threading.Thread(target=self._run_stage, args=(name,), name=f"boot-{name}", daemon=True).start()
+        return self
+
+    def result(self, name, timeout=None):
+        """Wait for a stage and return its result (re-raising its exception)."""
+        return self._stages[name][2].result(timeout)
+
+    def wait(self, timeout=None):
+        """Wait for all stages; returns True if every one succeeded."""
+        ok = True
+        for name in self._stages:
+            try:
+                self.result(name, timeout)
+            except Exception:
+                ok = False
+        return ok
+
+    def mark(self, milestone):
+        """Log a milestone the first time it is reached."""
+        with self._lock:
+            if milestone in self.milestones:
+                return
+            self.milestones[milestone] = time.monotonic() - self.started_at
+        uptime = _uptime()
+        since_power_on = f", {uptime:.1f}s since power-on" if uptime is not None else ''
+        print(f"Boot: {milestone} at {self.milestones[milestone]:.2f}s{since_power_on}")
+
+    def _run_stage(self, name):
+        func, after, future = self._stages[name]
+        try:
+            results = {dependency: self.result(dependency) for dependency in after}
+        except Exception as e:
+            future.set_exception(RuntimeError(f"{name} skipped: a dependency failed ({e})"))
+            print(f"Boot stage {name} skipped: {e}")
+            return
+
+        started = time.monotonic()
+        try:
+            result = func(**results)
+        except Exception as e:
+            print(f"Boot stage {name} failed: {e}")
+            future.set_exception(e)
+            return
+        finally:
+            duration = time.monotonic() - started
+            self.timings[name] = (started - self.started_at, duration)
+            print(f"Boot stage {name}: started at {started - self.started_at:.2f}s, took {duration:.2f}s")
+        future.set_result(result)
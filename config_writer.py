@@ -0,0 +1,97 @@
+import atexit
+import os
+import re
+import tempfile
+import threading
+import toml
+
+from station_catalog import PRESET_KEYS
+
+
+def atomic_write(path, data):
+    """Replace path with data so readers only ever see the old or the new file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w') as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Persist the rename itself
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class ConfigWriter:
+    """Buffers preset changes in memory and flushes them to config.toml in one atomic write."""
+
+    def __init__(self, catalog, delay=1.0):
+        self.catalog = catalog
+        self.config_path = catalog.config_path
+        self.delay = delay
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def set_preset(self, key, url):
+        """Queue a preset change; writes arriving within `delay` seconds are merged."""
+        if key not in PRESET_KEYS:
+            raise ValueError(f"Unknown preset: {key}")
+        with self._lock:
+            self._pending[key] = url
+            self.catalog.set_preset(key, url)
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write all pending preset changes to disk."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return True
+            try:
+                with open(self.config_path, 'r') as config_file:
+                    text = config_file.read()
+                for key, url in self._pending.items():
+                    text = self._replace_top_level_value(text, key, url)
+                atomic_write(self.config_path, text)
+            except OSError as e:
+                # Keep the changes so the next flush retries them
+                print(f"Error writing config: {e}")
+                return False
+            print(f"Saved presets: {self._pending}")
+            self._pending.clear()
+            return True
+
+    @staticmethod
+    def _replace_top_level_value(text, key, value):
+        """Rewrite only the `key = ...` line before the first table, leaving the rest untouched."""
+        line = toml.dumps({key: value}).strip()
+        table_match = re.search(r'^\s*\[', text, re.MULTILINE)
+        header_end = table_match.start() if table_match else len(text)
+        header, body = text[:header_end], text[header_end:]
+
+        pattern = re.compile(r'^' + re.escape(key) + r'\s*=.*$', re.MULTILINE)
+        if pattern.search(header):
+            header = pattern.sub(lambda match: line, header, count=1)
+        else:
+            header = line + '\n' + header
+        return header + body
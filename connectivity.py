@@ -0,0 +1,98 @@
+import http.client
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_TARGET = '8.8.8.8:53'
+
+_prober = None
+_prober_lock = threading.Lock()
+
+
+class ConnectivityProber:
+    """Checks internet access with a short TCP connect or HTTP 204 request instead of ping.
+
+    target is either "host:port" (TCP connect) or an http(s) URL that should
+    answer 204. Results are cached for ttl seconds and callers arriving while
+    a probe is running wait for that probe instead of starting another one.
+    """
+
+    def __init__(self, target=DEFAULT_TARGET, timeout=2, ttl=5):
+        self.target = target
+        self.timeout = timeout
+        self.ttl = ttl
+        self.connected = False
+        self.rtt = None
+        self.error = None
+        self.checked_at = None
+        self._probing = False
+        self._condition = threading.Condition()
+
+    def check(self, max_age=None):
+        """Return True if the target is reachable, using a cached result younger than max_age."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._condition:
+            if self.checked_at is not None and time.monotonic() - self.checked_at <= max_age:
+                return self.connected
+            if self._probing:
+                self._condition.wait_for(lambda: not self._probing)
+                return self.connected
+            self._probing = True
+
+        connected, rtt, error = False, None, None
+        try:
+            rtt = self._probe()
+            connected = True
+        except (OSError, http.client.HTTPException) as e:
+            error = str(e)
+        except Exception as e:
+            # A malformed target must not leave _probing set and every later caller waiting forever
+            error = f"probe failed: {e!r}"
+        finally:
+            with self._condition:
+                self.connected, self.rtt, self.error = connected, rtt, error
+                self.checked_at = time.monotonic()
+                self._probing = False
+                self._condition.notify_all()
+        return connected
+
+    def snapshot(self):
+        """Return the last probe result as a dictionary."""
+        with self._condition:
+            return {
+                'connected': self.connected,
+                'rtt_ms': round(self.rtt * 1000, 1) if self.rtt is not None else None,
+                'target': self.target,
+                'error': self.error
+            }
+
+    def _probe(self):
+        """Run one probe and return its round-trip time in seconds."""
+        started = time.monotonic()
+        if self.target.startswith(('http://', 'https://')):
+            url = urlsplit(self.target)
+            connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(url.hostname, url.port, timeout=self.timeout)
+            try:
+                connection.request('GET', url.path or '/')
+                response = connection.getresponse()
+                response.read()
+                if response.status != 204:
+                    raise OSError(f"unexpected status {response.status}")
+            finally:
+                connection.close()
+        else:
+            host, _, port = self.target.rpartition(':')
+            with socket.create_connection((host.strip('[]'), int(port)), timeout=self.timeout):
+                pass
+        return time.monotonic() - started
+
+
+def get_prober():
+    """Return the process-wide connectivity prober."""
+    global _prober
+    with _prober_lock:
+        if _prober is None:
+            _prober = ConnectivityProber()
+        return _prober
@@ -0,0 +1,103 @@
+import itertools
+import math
+
+from volume_controller import VolumeController
+
+CROSSFADE_SECONDS = 2.0
+START_TIMEOUT = 10  # Seconds the incoming station may take to start before the old one is cut
+MIN_AVAILABLE_MB = 64  # Below this MemAvailable switches are hard cuts rather than two players at once
+
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo in MB, or None if it cannot be read."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class Crossfader:
+    """Fades from an outgoing player to an incoming one with an equal-power curve.
+
+    The fade position (0-100) is ramped by a VolumeController whose setter
+    hands every step to the audio engine thread, so the fade is applied in
+    order with all other player commands. The methods here run on the engine
+    thread too. on_done(outgoing) is called once the outgoing player is silent
+    and can be stopped or kept as a standby.
+    """
+
+    def __init__(self, engine, duration=CROSSFADE_SECONDS):
+        self.engine = engine
+        self.duration = duration
+        self.outgoing = None
+        self.incoming = None
+        self.volume = 0
+        self.position = 0
+        self.fading = False
+        self._on_done = None
+        self._generation = itertools.count()
+        self._current = next(self._generation)
+        self._ramp = VolumeController(self._submit, volume=0)
+
+    @property
+    def active(self):
+        return self.outgoing is not None
+
+    def prepare(self, outgoing, incoming, volume, on_done):
+        """Keep outgoing playing at volume while incoming buffers silently."""
+        self.finish()
+        self.outgoing = outgoing
+        self.incoming = incoming
+        self.volume = volume
+        self.position = 0
+        self._on_done = on_done
+        incoming.audio_set_volume(0)
+
+    def begin(self, incoming):
+        """Start fading once incoming plays; ignored if incoming is not the player being faded in."""
+        if incoming is not self.incoming or self.fading:
+            return
+        self.fading = True
+        self._current = next(self._generation)
+        self._ramp.set(0)
+        self._ramp.ramp(100, self.duration, curve='linear')
+
+    def set_volume(self, volume):
+        """Change the target volume in the middle of a fade."""
+        self.volume = volume
+        self._apply_position()
+
+    def finish(self):
+        """Cut to the incoming player at full volume now."""
+        if self.outgoing is None:
+            return
+        outgoing, on_done = self.outgoing, self._on_done
+        self.incoming.audio_set_volume(self.volume)
+        self.outgoing = self.incoming = self._on_done = None
+        self.fading = False
+        self._current = next(self._generation)  # Drops ramp steps still in the engine queue
+        on_done(outgoing)
+
+    def _submit(self, position):
+        # Called on the ramp thread
+        self.engine.submit(self._step, self._current, position)
+
+    def _step(self, generation, position):
+        if generation != self._current or not self.fading:
+            return
+        self.position = position
+        if position >= 100:
+            self.finish()
+        else:
+            self._apply_position()
+
+    def _apply_position(self):
+        if self.outgoing is None:
+            return
+        angle = self.position / 100 * math.pi / 2
+        self.outgoing.audio_set_volume(round(self.volume * math.cos(angle)))
+        self.incoming.audio_set_volume(round(self.volume * math.sin(angle)))
@@ -0,0 +1,97 @@
+import collections
+import queue
+import threading
+import time
+
+
+class InputDispatcher:
+    """Runs button and encoder actions on one thread, off the gpiozero callback threads.
+
+    GPIO callbacks only enqueue timestamped events. The dispatcher wakes on the
+    first event, gathers everything that arrives within one frame, then:
+    collapses button presses to the latest one, and sums encoder detents into a
+    single volume delta, scaling steps that come in quick succession so a fast
+    spin covers the range in one turn. Press-to-action latency is recorded for
+    every batch that ran an action.
+    """
+
+    def __init__(self, press_action, volume_action, frame=0.03, step=5, accel_steps=((0.03, 3), (0.08, 2))):
+        self.press_action = press_action
+        self.volume_action = volume_action
+        self.frame = frame
+        self.step = step
+        self.accel_steps = accel_steps
+        self.latencies = collections.deque(maxlen=100)
+        self._events = queue.Queue()
+        self._last_step_at = None
+        self._thread = None
+
+    def start(self):
+        """Start the dispatcher thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='input-dispatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def press(self, key):
+        """Queue a button press (safe to call from a GPIO callback)."""
+        self._events.put(('press', key, time.monotonic()))
+
+    def rotate(self, direction):
+        """Queue one encoder detent; direction is 1 or -1."""
+        self._events.put(('rotate', direction, time.monotonic()))
+
+    def stats(self):
+        """Return press-to-action latency figures in milliseconds."""
+        latencies = sorted(latency for _, latency in self.latencies)
+        if not latencies:
+            return {'count': 0, 'p50_ms': None, 'max_ms': None}
+        return {
+            'count': len(latencies),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1)
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._events.get()]
+            # Let the rest of a burst (a spin, a bouncing contact) arrive before acting
+            time.sleep(self.frame)
+            while True:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                print(f"Input action failed: {e}")
+
+    def _dispatch(self, batch):
+        key, pressed_at, delta, rotated_at = None, None, 0, None
+        for kind, value, at in batch:
+            if kind == 'press':
+                key, pressed_at = value, at
+            else:
+                delta += value * self.step * self._acceleration(at)
+                rotated_at = rotated_at or at
+
+        if key is not None:
+            self.press_action(key)
+            self._record('press', pressed_at)
+        if delta:
+            self.volume_action(delta)
+            self._record('volume', rotated_at)
+
+    def _acceleration(self, at):
+        gap = None if self._last_step_at is None else at - self._last_step_at
+        self._last_step_at = at
+        for max_gap, multiplier in self.accel_steps:
+            if gap is not None and gap < max_gap:
+                return multiplier
+        return 1
+
+    def _record(self, kind, started_at):
+        latency = time.monotonic() - started_at
+        self.latencies.append((kind, latency))
+        print(f"Input {kind} handled in {latency * 1000:.0f} ms")
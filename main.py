@@ -5,34 +5,61 @@ import threading
 import time
 import os
 
-from gpiozero import Button, RotaryEncoder, LED
 from signal import pause
 
-from stream_manager import StreamManager
-from app import create_app
-from sounds import SoundManager
-from wifi_manager import WiFiManager
-
-from flask import Flask, Blueprint
+from boot import BootSequence
 
-# Create the Flask app
-app = create_app()
+# Timed from here; VLC, GPIO, Flask and the catalog are imported inside their stages
+boot = BootSequence()
 
-# Initialize managers with the app instance
-wifi_manager = WiFiManager(app)
+from wifi_manager import WiFiManager
+from network_state import get_network_state
+from input_dispatcher import InputDispatcher
+from metrics import timed_run
+from playback_journal import PlaybackJournal
 
 volume = 50
 sound_folder = "/home/radio/internetRadio/sounds"
+HOT_PRESETS = False  # Keep standby players for the preset buttons (costs bandwidth)
+MAX_STANDBY_PRESETS = 2
+TIMESHIFT_MINUTES = 0  # Record the playing preset so it can be paused and rewound (0 turns it off)
+CROSSFADE_SECONDS = 0  # Fade between presets on two players instead of cutting (0 turns it off)
+
+LED_PIN = 24
+ENCODER_BUTTON = 10  # Pin 19 (GPIO10)
+BUTTON1_PIN = 17  # Pin 11 (GPIO17) with GND on Pin 9
+BUTTON2_PIN = 16  # Pin 36 (GPIO16) with GND on Pin 34
+BUTTON3_PIN = 26  # Pin 37 (GPIO26) with GND on Pin 39
+DT_PIN = 9    # Changed from 5 to 9 (GPIO9)
+CLK_PIN = 11  # Changed from 6 to 11 (GPIO11)
+
+# Filled in by the boot stages below
 stream_manager = None
 sound_manager = None
+output_volume = None
+app = None
+led = None
+gpio_devices = []
+
+# Routes are attached once the web stage has built the app
+wifi_manager = WiFiManager()
+
+# Last station, volume and play/stop state, restored at boot
+journal = PlaybackJournal()
 
 def run_flask_app():
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    from web_server import serve
+    serve(app, host='0.0.0.0', port=5000)
 
 def button_handler(stream_key):
     # print(f"Button pressed for {stream_key}")
     if stream_manager.current_key == stream_key:
-        stream_manager.stop_stream()
+        # With timeshift a second press pauses instead, and the station keeps recording
+        if stream_manager.timeshift:
+            if not stream_manager.pause_stream():
+                stream_manager.resume_stream()
+        else:
+            stream_manager.stop_stream()
     else:
         stream_manager.play_stream(stream_key)
 
@@ -42,38 +69,43 @@ def restart_pi():
     time.sleep(2)  # Add a small delay to ensure the sound plays
     os.system("sudo reboot")
 
-def volume_up(encoder):
+def change_volume(delta):
     global volume, stream_manager
     if stream_manager:
-        volume = min(100, volume + 5)  # Increase by 5, max 100
-        print(f"Volume Up: {volume}")
+        volume = max(0, min(100, volume + delta))
+        print(f"Volume: {volume}")
         stream_manager.set_volume(volume)
 
-def volume_down(encoder):
-    global volume, stream_manager
-    if stream_manager:
-        volume = max(0, volume - 5)  # Decrease by 5, min 0
-        print(f"Volume Down: {volume}")
-        stream_manager.set_volume(volume)
+# GPIO callbacks only queue events; actions run on the dispatcher thread
+input_dispatcher = InputDispatcher(button_handler, change_volume)
 
 def check_wifi():
-    try:
-        # Check if connected to a Wi-Fi network (router)
-        result = subprocess.run(['iwgetid'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if result.returncode == 0:  # Return code 0 means connected to a Wi-Fi network
-            network_name = result.stdout.decode().strip()
-            print(f"Connected to network: {network_name}")
-            return True
-        else:
-            print("Not connected to any Wi-Fi network.")
-            return False
-    except Exception as e:
-        print(f"Error checking Wi-Fi: {e}")
+    # Read the cached state kept current by NetworkManager events
+    state = get_network_state().snapshot()
+    if state['connected']:
+        print(f"Connected to network: {state['ssid']}")
+        return True
+    else:
+        print("Not connected to any Wi-Fi network.")
         return False
 
+wifi_lost = False
+
+def handle_network_change(state):
+    global wifi_lost
+    if not state['connected'] and not wifi_lost:
+        print("WiFi connection lost")
+        sound_manager.play_sound("noWifi.wav")
+        led.blink(on_time=0.5, off_time=0.5)
+        wifi_lost = True
+    elif state['connected'] and wifi_lost:
+        sound_manager.play_sound("wifi.wav")
+        led.blink(on_time=3, off_time=3)
+        wifi_lost = False
+
 def get_ip_address(interface='wlan0'):
     try:
-        result = subprocess.check_output(['ip', 'addr', 'show', interface]).decode()
+        result = timed_run(['ip', 'addr', 'show', interface], capture_output=True, text=True, check=True).stdout
         for line in result.splitlines():
             if 'inet ' in line:
                 ip_address = line.strip().split()[1].split('/')[0]
@@ -84,7 +116,7 @@ def get_ip_address(interface='wlan0'):
 def start_hotspot():
     try:
         print("Starting Wi-Fi hotspot...")
-        subprocess.run(['sudo', 'nmcli', 'device', 'wifi', 'hotspot', 'ssid', 'Radio', 'password', 'Radio@1234', 'ifname', 'wlan0'], check=True)
+        timed_run(['sudo', 'nmcli', 'device', 'wifi', 'hotspot', 'ssid', 'Radio', 'password', 'Radio@1234', 'ifname', 'wlan0'], check=True)
         ip_address = get_ip_address('wlan0')
         if ip_address:
             print(f"Hotspot started successfully. Visit http://{ip_address}:5000 to configure Wi-Fi settings.")
@@ -94,91 +126,80 @@ def start_hotspot():
         print(f"Error starting hotspot: {e}") 
 
 def fade_volume_down():
-    # Fade out from current volume to 0%
-    for vol in range(100, -1, -10):
-        subprocess.run(['amixer', 'set', 'PCM', f'{vol}%'], capture_output=True)
-        time.sleep(0.05)
+    # Fade out from current volume to 0%; wait() on the result to block until silent
+    return output_volume.ramp(0, duration=0.5)
 
 def fade_volume_up():
     # Fade in from 0% to 100%
-    subprocess.run(['amixer', 'set', 'PCM', '0%'], capture_output=True)
-    time.sleep(0.1)  # Small delay before starting playback
-    for vol in range(0, 101, 10):
-        subprocess.run(['amixer', 'set', 'PCM', f'{vol}%'], capture_output=True)
-        time.sleep(0.05)
+    output_volume.set(0)
+    return output_volume.ramp(100, duration=0.5)
 
 # Use before shutdown/reboot
 def safe_shutdown():
-    fade_volume_down()
-    time.sleep(0.2)  # Small delay before actual shutdown
-    subprocess.run(['sudo', 'shutdown', '-h', 'now'])
+    fade_volume_down().wait(2)
+    timed_run(['sudo', 'shutdown', '-h', 'now'])
 
 # Use before reboot
 def safe_reboot():
-    fade_volume_down()
-    time.sleep(0.2)  # Small delay before actual reboot
-    subprocess.run(['sudo', 'reboot'])
+    fade_volume_down().wait(2)
+    timed_run(['sudo', 'reboot'])
 
 def shutdown_sequence():
     # Set volume to 0 before shutdown
-    subprocess.run(['amixer', 'set', 'PCM', '0%'], capture_output=True)
-    time.sleep(0.2)  # Wait for audio to settle
-    subprocess.run(['sudo', 'shutdown', '-h', 'now'])
+    output_volume.set(0)
+    timed_run(['sudo', 'shutdown', '-h', 'now'])
 
 def startup_sequence():
-    # Start with volume at 0
-    subprocess.run(['amixer', 'set', 'PCM', '0%'], capture_output=True)
-    time.sleep(0.2)  # Wait for system to settle
-    # Then gradually increase
-    for vol in range(0, 101, 10):
-        subprocess.run(['amixer', 'set', 'PCM', f'{vol}%'], capture_output=True)
-        time.sleep(0.05)
-
-if __name__ == "__main__":
-    sound_manager = SoundManager(sound_folder)
+    # Start with volume at 0, then ramp up in the background
+    return fade_volume_up()
+
+def start_audio():
+    """Boot stage: audio engine, stream manager and sound cues."""
+    global stream_manager, sound_manager, output_volume, volume
+    from stream_manager import StreamManager
+    from sounds import SoundManager
+    from volume_controller import VolumeController, mixer_setter
+
+    # One stream manager on the shared audio engine for both the web UI and the buttons
+    volume = journal.state['volume']
+    stream_manager = StreamManager(volume, hot_presets=HOT_PRESETS, max_standby=MAX_STANDBY_PRESETS,
+                                   timeshift_minutes=TIMESHIFT_MINUTES, crossfade_seconds=CROSSFADE_SECONDS)
+    stream_manager.player_state.subscribe(journal.observe)
+    stream_manager.player_state.subscribe(
+        lambda state: state['state'] == 'playing' and boot.mark('first audio'))
+    # PCM fades run in-process on the ramp thread
+    output_volume = VolumeController(mixer_setter('PCM'))
+    sound_manager = SoundManager(sound_folder, duck=stream_manager.duck)
     sound_manager.play_sound("boot.wav")
+    input_dispatcher.start()
+    return stream_manager
+
+def load_catalog():
+    """Boot stage: parse config.toml and build the search index."""
+    from station_catalog import get_catalog
+    catalog = get_catalog()
+    catalog.index
+    return catalog
 
-    LED_PIN = 24
-    ENCODER_BUTTON = 10  # Pin 19 (GPIO10)
+def setup_gpio():
+    """Boot stage: LED, buttons and encoder. Presses queue up until the audio stage starts the dispatcher."""
+    global led
+    from gpiozero import Button, RotaryEncoder, LED
 
     led = LED(LED_PIN)
     led.on()
-    
+
     buttonEn = Button(ENCODER_BUTTON, pull_up=True, bounce_time=0.2, hold_time=2)
     buttonEn.when_pressed = lambda: print("Encoder Pressed")
     buttonEn.when_held = lambda: restart_pi()
-    
-    if not check_wifi():
-        print("Starting Wi-Fi hotspot...")
-        start_hotspot()  
-
-    flask_thread = threading.Thread(target=run_flask_app, daemon=True)
-    flask_thread.start()
-
-    while not check_wifi():
-        led.blink(on_time=1, off_time=1)
-        print("Waiting for Wi-Fi connection...")
-        time.sleep(5) 
-
-    led.blink(on_time=3, off_time=3)
-    sound_manager.play_sound("wifi.wav")
-    stream_manager = StreamManager(volume)
-    print (volume)
-
-    BUTTON1_PIN = 17  # Pin 11 (GPIO17) with GND on Pin 9
-    BUTTON2_PIN = 16  # Pin 36 (GPIO16) with GND on Pin 34
-    BUTTON3_PIN = 26  # Pin 37 (GPIO26) with GND on Pin 39
 
     button1 = Button(BUTTON1_PIN, pull_up=True, bounce_time=0.2)
     button2 = Button(BUTTON2_PIN, pull_up=True, bounce_time=0.2)
     button3 = Button(BUTTON3_PIN, pull_up=True, bounce_time=0.2)
 
-    button1.when_pressed = lambda: button_handler('link1')
-    button2.when_pressed = lambda: button_handler('link2')
-    button3.when_pressed = lambda: button_handler('link3')
-
-    DT_PIN = 9    # Changed from 5 to 9 (GPIO9)
-    CLK_PIN = 11  # Changed from 6 to 11 (GPIO11)
+    button1.when_pressed = lambda: input_dispatcher.press('link1')
+    button2.when_pressed = lambda: input_dispatcher.press('link2')
+    button3.when_pressed = lambda: input_dispatcher.press('link3')
 
     encoder = RotaryEncoder(
         DT_PIN, 
@@ -188,24 +209,89 @@ if __name__ == "__main__":
         wrap=False, 
         threshold_steps=(0,100)
     )
-    encoder.when_rotated_clockwise = lambda rotation: volume_up(rotation)
-    encoder.when_rotated_counter_clockwise = lambda rotation: volume_down(rotation)
-    
-    played = False
+    encoder.when_rotated_clockwise = lambda rotation: input_dispatcher.rotate(1)
+    encoder.when_rotated_counter_clockwise = lambda rotation: input_dispatcher.rotate(-1)
+
+    # gpiozero releases pins of devices that are garbage collected
+    gpio_devices.extend([led, buttonEn, button1, button2, button3, encoder])
+    return gpio_devices
+
+def start_web(audio, catalog):
+    """Boot stage: Flask app, the Server-Sent Events server and the LAN relay."""
+    global app
+    from app import create_app
+    from player_events import EventStreamServer
+    from stream_relay import StreamRelay
+    from metrics import Gauge
+
+    app = create_app(audio)
+    wifi_manager.init_app(app)
+    flask_thread = threading.Thread(target=run_flask_app, daemon=True)
+    flask_thread.start()
+
+    # Player state pushed to the web UI as Server-Sent Events
+    EventStreamServer(audio.player_state).start()
+
+    # One upstream connection shared by every LAN listener on /listen
+    relay = StreamRelay(audio.player_state, resolve=audio.resolver.resolve).start()
+    Gauge('radio_relay_listeners', 'Listeners connected to the LAN relay', lambda: relay.listener_count)
+    return app
+
+def bring_up_network():
+    """Boot stage: join a saved network or fall back to the hotspot."""
+    network_state = get_network_state()
+
+    # Try saved networks best-first; this falls back to AP mode when none of them work
+    if not check_wifi() and not wifi_manager.try_connect_saved_networks():
+        print("Starting Wi-Fi hotspot...")
+        start_hotspot()
+    return network_state
+
+def start_playback(audio, network, gpio):
+    """Boot stage: as soon as there is a connection, get the presets ready to play."""
+    from station_health import get_health_checker
+
+    if not check_wifi():
+        led.blink(on_time=1, off_time=1)
+        print("Waiting for Wi-Fi connection...")
+        network.wait_for_connection()
+    boot.mark('network connected')
+
+    led.blink(on_time=3, off_time=3)
+    sound_manager.play_sound("wifi.wav")
+    audio.resolve_presets()
+    audio.warm_presets()
+    get_health_checker().start()  # Re-checks catalog stations in the background
+    print (volume)
+
+    # LED and sound cues follow NetworkManager events instead of polling
+    network.subscribe(handle_network_change)
+
+def restore_playback(audio, network):
+    """Boot stage: resume the station that was playing before the restart as soon as there is a connection."""
+    state = journal.state
+    if state['playing'] and state['key']:
+        network.wait_for_connection()
+        print(f"Resuming {state['key']} at volume {state['volume']}")
+        audio.play_stream(state['key'])
+        boot.mark('playback restored')
+
+if __name__ == "__main__":
+    # Independent stages run in parallel; each logs when it started and how long it took
+    boot.stage('audio', start_audio)
+    boot.stage('catalog', load_catalog)
+    boot.stage('gpio', setup_gpio)
+    boot.stage('network', bring_up_network)
+    boot.stage('web', start_web, after=('audio', 'catalog'))
+    boot.stage('playback', start_playback, after=('audio', 'network', 'gpio'))
+    boot.stage('restore', restore_playback, after=('audio', 'network'))
+    boot.run()
+
+    if boot.wait():
+        boot.mark('boot complete')
 
     while True:
-        wifi_status = check_wifi()
-        if not wifi_status and not played:
-            print("WiFi connection lost")
-            sound_manager.play_sound("noWifi.wav")
-            led.blink(on_time=0.5, off_time=0.5)
-            played = True
-        elif wifi_status and played:
-            sound_manager.play_sound("wifi.wav")
-            led.blink(on_time=3, off_time=3)
-            played = False
-        
-        time.sleep(30)
+        pause()
 
     app.debug = True  # Add this line
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,214 @@
+import bisect
+import os
+import subprocess
+import threading
+import time
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metric:
+    """Base for metrics with optional labels; label values are passed in the order of labelnames."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _labels(self, values):
+        if not values:
+            return ''
+        pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values))
+        return '{' + pairs + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _render_samples(self, items):
+        return [f"{self.name}{self._labels(labels)} {_number(value)}" for labels, value in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Only the bucket the value falls in is counted; render() accumulates them
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        """Context manager that observes the wall time of its block."""
+        return _Timer(self, labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket_labels = self._labels(labels)[:-1] + ',' if labels else '{'
+                lines.append(f'{self.name}_bucket{bucket_labels}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {count}")
+        return lines
+
+
+class Gauge(Metric):
+    """A value read from a callback at scrape time, so it costs nothing in between."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read, kind='gauge'):
+        super().__init__(name, help_text)
+        self.read = read
+        self.kind = kind
+
+    def _render_samples(self, items):
+        value = self.read()
+        return [] if value is None else [f"{self.name} {_number(value)}"]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _read_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _read_cpu_seconds():
+    try:
+        with open('/proc/self/stat') as f:
+            # Skip past the command name, which may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+REGISTRY = Registry()
+
+BUTTON_TO_AUDIO = Histogram('radio_button_to_first_audio_seconds',
+                            'Time from a preset press to the buffer being full', ('mode',))
+SWITCH_GAP = Histogram('radio_switch_gap_seconds', 'Silence heard between the old station and the new one', ('mode',))
+STATION_SWITCH = Histogram('radio_station_switch_seconds', 'Time spent in the station switch command', ('mode',))
+REBUFFERS = Counter('radio_rebuffers_total', 'Times the playing stream ran out of buffer')
+STREAM_FAILURES = Counter('radio_stream_failures_total', 'Stream failures by reason', ('reason',))
+STREAM_RECONNECT = Histogram('radio_stream_reconnect_seconds', 'Time from a stream failure to audio again')
+WIFI_SCAN = Histogram('radio_wifi_scan_seconds', 'Wi-Fi scan duration')
+WIFI_CONNECT = Histogram('radio_wifi_connect_seconds', 'Time to join a saved Wi-Fi network', ('result',))
+SUBPROCESS_CALLS = Counter('radio_subprocess_calls_total', 'Subprocesses started, by command', ('command',))
+SUBPROCESS_SECONDS = Histogram('radio_subprocess_seconds', 'Subprocess wall time, by command', ('command',))
+HTTP_REQUESTS = Histogram('radio_http_request_seconds', 'Flask request latency',
+                          ('method', 'route', 'status'))
+RELAY_DROPPED = Counter('radio_relay_dropped_listeners_total', 'LAN relay listeners dropped for reading too slowly')
+Gauge('process_resident_memory_bytes', 'Resident memory size in bytes', _read_rss_bytes)
+Gauge('process_cpu_seconds_total', 'User and system CPU time in seconds', _read_cpu_seconds, kind='counter')
+
+
+def command_label(args):
+    """Name a command for metrics: the program and its subcommand, without sudo or options."""
+    words = args.split() if isinstance(args, str) else list(args)
+    if words[:1] == ['sudo']:
+        words = words[1:]
+    if not words:
+        return ''
+    subcommand = next((word for word in words[1:] if word.isalpha() and word.islower()), None)
+    program = os.path.basename(words[0])
+    return f"{program} {subcommand}" if subcommand else program
+
+
+def timed_run(args, **kwargs):
+    """subprocess.run that counts the call and records its wall time per command."""
+    label = command_label(args)
+    SUBPROCESS_CALLS.inc(label)
+    started = time.monotonic()
+    try:
+        return subprocess.run(args, **kwargs)
+    finally:
+        SUBPROCESS_SECONDS.observe(time.monotonic() - started, label)
+
+
+def instrument_flask(app):
+    """Record the latency of every Flask request by route and serve /metrics."""
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.monotonic()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUESTS.observe(time.monotonic() - started, request.method, route, str(response.status_code))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
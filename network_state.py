@@ -0,0 +1,225 @@
+import logging
+import re
+import subprocess
+import threading
+import time
+
+from metrics import timed_run
+
+INTERFACE = 'wlan0'
+
+_DEVICE_STATE_RE = re.compile(r"^(\S+): (connected|disconnected|unavailable|unmanaged|deactivating|connecting.*|disconnecting.*)$")
+_USING_CONNECTION_RE = re.compile(r"^(\S+): using connection '(.*)'$")
+_CONNECTIVITY_RE = re.compile(r"^Connectivity is now '(\w+)'")
+
+_network_state = None
+_network_state_lock = threading.Lock()
+
+
+def _split_terse(line):
+    """Split a line of `nmcli -t` output on unescaped colons."""
+    return [field.replace('\\:', ':') for field in re.split(r'(?<!\\):', line)]
+
+
+def nmcli_monitor():
+    """Yield change events from `nmcli monitor` until the process exits."""
+    process = subprocess.Popen(['nmcli', 'monitor'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in process.stdout:
+            yield line.rstrip('\n')
+    finally:
+        process.kill()
+        process.wait()
+
+
+def query_nmcli(interface=INTERFACE):
+    """Read the current device state, connection and connectivity from NetworkManager."""
+    state = {'device_state': 'disconnected', 'connection': None, 'connectivity': 'unknown'}
+    result = timed_run(['nmcli', '-t', '-f', 'DEVICE,STATE,CONNECTION', 'device'],
+                       capture_output=True, text=True, timeout=5)
+    for line in result.stdout.splitlines():
+        fields = _split_terse(line)
+        if len(fields) >= 3 and fields[0] == interface:
+            state['device_state'] = fields[1]
+            state['connection'] = fields[2] or None
+
+    result = timed_run(['nmcli', 'networking', 'connectivity'], capture_output=True, text=True, timeout=5)
+    state['connectivity'] = result.stdout.strip() or 'unknown'
+    return state
+
+
+def query_connection(name):
+    """Return (ssid, mode) of a saved NetworkManager connection."""
+    result = timed_run(
+        ['nmcli', '-t', '-f', '802-11-wireless.ssid,802-11-wireless.mode', 'connection', 'show', name],
+        capture_output=True, text=True, timeout=5
+    )
+    details = {}
+    for line in result.stdout.splitlines():
+        fields = _split_terse(line)
+        if len(fields) >= 2:
+            details[fields[0]] = ':'.join(fields[1:])
+    return details.get('802-11-wireless.ssid') or name, details.get('802-11-wireless.mode', '')
+
+
+class NetworkState:
+    """In-memory Wi-Fi state kept current from NetworkManager change events.
+
+    The event source is any callable returning an iterable of `nmcli monitor`
+    style lines, so the service can be driven by a fake source without radio
+    hardware. Reads never spawn a process.
+    """
+
+    def __init__(self, interface=INTERFACE, event_source=nmcli_monitor, query=query_nmcli,
+                 connection_query=query_connection, poll_interval=30):
+        self.interface = interface
+        self.event_source = event_source
+        self.query = query
+        self.connection_query = connection_query
+        self.poll_interval = poll_interval
+        self.ssid = None
+        self.connection = None
+        self.device_state = 'unknown'
+        self.connectivity = 'unknown'
+        self.ap_mode = False
+        self.updated_at = None
+        self._subscribers = []
+        self._last_notified = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @property
+    def connected(self):
+        """True when wlan0 is connected to a network as a client (not our own AP)."""
+        return self.device_state == 'connected' and not self.ap_mode
+
+    def snapshot(self):
+        """Return the current state as a dictionary."""
+        with self._condition:
+            return {
+                'connected': self.connected,
+                'ssid': self.ssid,
+                'ap_mode': self.ap_mode,
+                'connectivity': self.connectivity,
+                'device_state': self.device_state,
+                'updated_at': self.updated_at
+            }
+
+    def subscribe(self, callback):
+        """Call callback(snapshot) whenever the reported state changes."""
+        self._subscribers.append(callback)
+
+    def wait_for_connection(self, timeout=None):
+        """Block until connected as a client or the timeout expires; returns the connected flag."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.connected, timeout)
+
+    def wait_for_connectivity(self, timeout=None):
+        """Block until connected with full internet connectivity or the timeout expires."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.connected and self.connectivity == 'full', timeout)
+
+    def start(self):
+        """Load the initial state and follow change events on a background thread."""
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._follow_events, name='network-state', daemon=True)
+            self._thread.start()
+        return self
+
+    def refresh(self):
+        """Re-read the full state from NetworkManager."""
+        try:
+            state = self.query(self.interface)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.error(f"Error reading network state: {e}")
+            return
+        connection = self._lookup_connection(state['connection'])
+        with self._condition:
+            self.device_state = state['device_state']
+            self.connectivity = state['connectivity']
+            self.connection, self.ssid, self.ap_mode = connection
+        self._changed()
+
+    def apply_event(self, line):
+        """Update the state from one `nmcli monitor` line."""
+        match = _DEVICE_STATE_RE.match(line)
+        if match and match.group(1) == self.interface:
+            with self._condition:
+                self.device_state = match.group(2).split()[0]
+                if self.device_state in ('disconnected', 'unavailable', 'unmanaged'):
+                    self.connection, self.ssid, self.ap_mode = None, None, False
+            self._changed()
+            return
+
+        match = _USING_CONNECTION_RE.match(line)
+        if match and match.group(1) == self.interface:
+            connection = self._lookup_connection(match.group(2))
+            with self._condition:
+                self.connection, self.ssid, self.ap_mode = connection
+            self._changed()
+            return
+
+        match = _CONNECTIVITY_RE.match(line)
+        if match:
+            with self._condition:
+                self.connectivity = match.group(1)
+            self._changed()
+
+    def _lookup_connection(self, connection):
+        """Return (connection, ssid, ap_mode), only querying NetworkManager for a new connection."""
+        if connection is None:
+            return None, None, False
+        if connection == self.connection:
+            return connection, self.ssid, self.ap_mode
+        try:
+            ssid, mode = self.connection_query(connection)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.error(f"Error reading connection {connection}: {e}")
+            ssid, mode = connection, ''
+        return connection, ssid, mode == 'ap'
+
+    def _changed(self):
+        with self._condition:
+            self.updated_at = time.time()
+            self._condition.notify_all()
+        snapshot = self.snapshot()
+        key = {k: v for k, v in snapshot.items() if k != 'updated_at'}
+        if key == self._last_notified:
+            return
+        self._last_notified = key
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Network state subscriber failed: {e}")
+
+    def _follow_events(self):
+        backoff = 1
+        while True:
+            try:
+                for line in self.event_source():
+                    backoff = 1
+                    self.apply_event(line)
+                logging.warning("Network event source ended, restarting")
+            except FileNotFoundError:
+                # No nmcli on this system, fall back to polling
+                logging.error("nmcli not available, polling network state")
+                time.sleep(self.poll_interval)
+                self.refresh()
+                continue
+            except Exception as e:
+                logging.error(f"Network event source failed: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            # Events may have been missed while the monitor was down
+            self.refresh()
+
+
+def get_network_state():
+    """Return the process-wide network state service, started on first use."""
+    global _network_state
+    with _network_state_lock:
+        if _network_state is None:
+            _network_state = NetworkState().start()
+        return _network_state
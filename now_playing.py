@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+HISTORY_LENGTH = 20  # Tracks remembered per station
+MAX_STATIONS = 50
+
+
+def parse_stream_title(block):
+    """Return the StreamTitle from an ICY metadata block, or None if it has none."""
+    text = block.rstrip(b'\0').decode('utf-8', errors='replace')
+    prefix = "StreamTitle='"
+    start = text.find(prefix)
+    if start < 0:
+        return None
+    title = text[start + len(prefix):]
+    end = title.find("';")
+    return (title[:end] if end >= 0 else title.rstrip("'")).strip()
+
+
+class IcyReader:
+    """Wraps a stream response requested with Icy-MetaData: 1 and returns audio only.
+
+    The metadata block sent every `metaint` bytes is cut out of the stream and
+    on_title(title) is called whenever StreamTitle changes. With metaint 0 (the
+    server sent no metadata) reads pass straight through.
+    """
+
+    def __init__(self, response, metaint, on_title=None):
+        self.response = response
+        self.metaint = metaint
+        self.on_title = on_title
+        self.title = None
+        self._until_meta = metaint
+
+    def read1(self, size):
+        if not self.metaint:
+            return self.response.read1(size)
+        data = self.response.read1(min(size, self._until_meta))
+        self._until_meta -= len(data)
+        if data and self._until_meta == 0:
+            self._read_metadata()
+            self._until_meta = self.metaint
+        return data
+
+    def _read_metadata(self):
+        length = self.response.read(1)
+        if not length:
+            return
+        block = self.response.read(length[0] * 16) if length[0] else b''
+        title = parse_stream_title(block) if block else None
+        if title and title != self.title:
+            self.title = title
+            if self.on_title:
+                self.on_title(title)
+
+
+class TrackHistory:
+    """Bounded ring of recent titles per station URL.
+
+    Only the MAX_STATIONS most recently heard stations are kept. `version`
+    changes with every new title so callers can cache what they build from it.
+    """
+
+    def __init__(self, length=HISTORY_LENGTH, max_stations=MAX_STATIONS):
+        self.length = length
+        self.max_stations = max_stations
+        self.version = 0
+        self._stations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, url, title):
+        """Add title as the newest track of url; returns False if it is already the current one."""
+        if not url or not title:
+            return False
+        with self._lock:
+            tracks = self._stations.get(url)
+            if tracks is None:
+                tracks = self._stations[url] = deque(maxlen=self.length)
+                while len(self._stations) > self.max_stations:
+                    self._stations.popitem(last=False)
+            self._stations.move_to_end(url)
+            if tracks and tracks[-1]['title'] == title:
+                return False
+            tracks.append({'title': title, 'started_at': round(time.time())})
+            self.version += 1
+            return True
+
+    def current(self, url):
+        with self._lock:
+            tracks = self._stations.get(url)
+            return tracks[-1]['title'] if tracks else None
+
+    def history(self, url):
+        """Tracks heard on url, newest first."""
+        with self._lock:
+            return list(reversed(self._stations.get(url, ())))
@@ -0,0 +1,76 @@
+import atexit
+import json
+import threading
+
+from config_writer import atomic_write
+
+JOURNAL_PATH = '/home/radio/internetRadio/playback_state.json'
+DEFAULT_STATE = {'key': None, 'volume': 50, 'playing': False}
+
+
+class PlaybackJournal:
+    """Remembers the last preset, volume and play/stop state across restarts.
+
+    Changes are merged in memory and written at most once per `delay` seconds
+    with atomic_write, so spinning the volume knob costs one small write
+    instead of one per detent.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, delay=2.0):
+        self.path = path
+        self.delay = delay
+        self.state = self.load()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def load(self):
+        """Read the saved state, falling back to the defaults."""
+        state = dict(DEFAULT_STATE)
+        try:
+            with open(self.path) as journal_file:
+                saved = json.load(journal_file)
+            state.update({key: saved[key] for key in DEFAULT_STATE if key in saved})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Error reading playback state from {self.path}: {e}")
+        return state
+
+    def record(self, **fields):
+        """Merge fields into the state and schedule a write if anything changed."""
+        with self._lock:
+            changed = {key: value for key, value in fields.items() if self.state.get(key) != value}
+            if not changed:
+                return
+            self.state.update(changed)
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def observe(self, snapshot):
+        """PlayerState listener: follow the preset stream, ignoring previews."""
+        fields = {'volume': snapshot['volume'], 'playing': snapshot['key'] is not None}
+        if snapshot['key'] is not None:
+            # Keep the last station after stop so it can be resumed
+            fields['key'] = snapshot['key']
+        self.record(**fields)
+
+    def flush(self):
+        """Write the state to disk if it changed."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            try:
+                atomic_write(self.path, json.dumps(self.state))
+            except OSError as e:
+                print(f"Error saving playback state: {e}")
+                return False
+            self._dirty = False
+            return True
@@ -0,0 +1,238 @@
+import json
+import queue
+import selectors
+import socket
+import threading
+import time
+
+EVENTS_PORT = 5001
+MAX_PENDING_BYTES = 64 * 1024
+
+
+class PlayerState:
+    """Versioned snapshot of what the radio is doing; listeners only hear about real changes."""
+
+    def __init__(self):
+        self._state = {
+            'state': 'stopped',
+            'key': None,
+            'url': None,
+            'name': None,
+            'volume': None,
+            'title': None,
+            'preview_url': None,
+            'preview_ends_at': None,
+            'paused': False,
+            'timeshift_delay': None
+        }
+        self.version = 0
+        self._listeners = []
+        self._condition = threading.Condition()
+
+    def update(self, **fields):
+        """Merge fields into the state and notify listeners if anything changed."""
+        with self._condition:
+            changed = {key: value for key, value in fields.items() if self._state.get(key) != value}
+            if not changed:
+                return False
+            self._state.update(changed)
+            self.version += 1
+            self._condition.notify_all()
+        snapshot = self.snapshot()
+        for listener in list(self._listeners):
+            listener(snapshot)
+        return True
+
+    def snapshot(self):
+        """Return the current state, including the remaining preview time in seconds."""
+        with self._condition:
+            snapshot = dict(self._state, version=self.version)
+        ends_at = snapshot.pop('preview_ends_at')
+        snapshot['preview_remaining'] = max(0, round(ends_at - time.monotonic())) if ends_at else 0
+        snapshot['is_running'] = snapshot['preview_url'] is not None
+        return snapshot
+
+    def subscribe(self, listener):
+        """Call listener(snapshot) after every change."""
+        self._listeners.append(listener)
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until the version differs from the given one; returns the snapshot."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+        return self.snapshot()
+
+
+class EventStreamServer:
+    """Serves PlayerState changes as Server-Sent Events to many clients from one thread.
+
+    Connections are multiplexed with a selector, so an open EventSource costs a
+    socket and a small buffer rather than a server thread. Clients that stop
+    reading are dropped once MAX_PENDING_BYTES are queued for them.
+    """
+
+    def __init__(self, player_state, host='0.0.0.0', port=EVENTS_PORT, path='/events',
+                 heartbeat=15, max_clients=64):
+        self.player_state = player_state
+        self.host = host
+        self.port = port
+        self.path = path
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self._selector = selectors.DefaultSelector()
+        self._messages = queue.Queue()
+        self._clients = {}
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._thread = None
+
+    def start(self):
+        """Bind the port and start serving on a background thread."""
+        if self._thread is None:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.port))
+            server.listen(16)
+            server.setblocking(False)
+            self.port = server.getsockname()[1]
+            self._selector.register(server, selectors.EVENT_READ, 'accept')
+            self._wake_reader.setblocking(False)
+            self._selector.register(self._wake_reader, selectors.EVENT_READ, 'wake')
+            self.player_state.subscribe(self._on_change)
+            self._thread = threading.Thread(target=self._run, name='player-events', daemon=True)
+            self._thread.start()
+        return self
+
+    def client_count(self):
+        return sum(1 for client in self._clients.values() if client['streaming'])
+
+    def _on_change(self, snapshot):
+        self._messages.put(self._format(snapshot))
+        try:
+            self._wake_writer.send(b'\0')
+        except OSError:
+            pass
+
+    @staticmethod
+    def _format(snapshot):
+        return f"data: {json.dumps(snapshot)}\n\n".encode()
+
+    def _run(self):
+        next_heartbeat = time.monotonic() + self.heartbeat
+        while True:
+            timeout = max(0, next_heartbeat - time.monotonic())
+            for key, mask in self._selector.select(timeout):
+                if key.data == 'accept':
+                    self._accept(key.fileobj)
+                elif key.data == 'wake':
+                    self._drain_messages()
+                else:
+                    if mask & selectors.EVENT_READ:
+                        self._read(key.fileobj)
+                    if mask & selectors.EVENT_WRITE and key.fileobj in self._clients:
+                        self._write(key.fileobj)
+            if time.monotonic() >= next_heartbeat:
+                # Comments keep proxies and the browser from timing the stream out
+                self._broadcast(b': ping\n\n')
+                next_heartbeat = time.monotonic() + self.heartbeat
+
+    def _accept(self, server):
+        try:
+            sock, _ = server.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        self._clients[sock] = {'request': bytearray(), 'out': bytearray(), 'streaming': False}
+        self._selector.register(sock, selectors.EVENT_READ, 'client')
+
+    def _read(self, sock):
+        client = self._clients[sock]
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(sock)
+            return
+        if client['streaming']:
+            return
+        client['request'] += data
+        if b'\r\n\r\n' not in client['request']:
+            if len(client['request']) > 8192:
+                self._close(sock)
+            return
+
+        request_line = bytes(client['request']).split(b'\r\n', 1)[0].decode('latin-1')
+        parts = request_line.split()
+        path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+        if parts[:1] != ['GET'] or path != self.path:
+            self._respond_and_close(sock, '404 Not Found')
+        elif self.client_count() >= self.max_clients:
+            self._respond_and_close(sock, '503 Service Unavailable')
+        else:
+            client['streaming'] = True
+            client['out'] += (
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'Connection: keep-alive\r\n'
+                b'Access-Control-Allow-Origin: *\r\n'
+                b'\r\n'
+                b'retry: 3000\n\n'
+            )
+            client['out'] += self._format(self.player_state.snapshot())
+            self._write(sock)
+
+    def _respond_and_close(self, sock, status):
+        client = self._clients[sock]
+        client['out'] += f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\nAccess-Control-Allow-Origin: *\r\n\r\n".encode()
+        client['close_after_write'] = True
+        self._write(sock)
+
+    def _drain_messages(self):
+        try:
+            while self._wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                message = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            self._broadcast(message)
+
+    def _broadcast(self, message):
+        for sock, client in list(self._clients.items()):
+            if client['streaming']:
+                if len(client['out']) + len(message) > MAX_PENDING_BYTES:
+                    self._close(sock)
+                    continue
+                client['out'] += message
+                self._write(sock)
+
+    def _write(self, sock):
+        client = self._clients[sock]
+        if client['out']:
+            try:
+                sent = sock.send(client['out'])
+                del client['out'][:sent]
+            except BlockingIOError:
+                pass
+            except OSError:
+                self._close(sock)
+                return
+        if not client['out'] and client.get('close_after_write'):
+            self._close(sock)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client['out'] else 0)
+        self._selector.modify(sock, events, 'client')
+
+    def _close(self, sock):
+        self._clients.pop(sock, None)
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import vlc
+
+from station_catalog import PRESET_KEYS
+
+
+class StandbyEntry:
+    def __init__(self, key, url, player):
+        self.key = key
+        self.url = url
+        self.player = player
+        self.ready = False
+        self.last_used = time.monotonic()
+
+
+class PresetStandby:
+    """Keeps muted standby players for the preset stations so a button press only unmutes one.
+
+    With prebuffer=True each standby player plays muted and keeps its network
+    buffer full, which costs one stream of bandwidth per standby. With
+    prebuffer=False the media is only parsed over the network (DNS, TLS and
+    HTTP connect) and playback starts on the press. At most max_standby
+    players are kept, and standbys not used for idle_timeout seconds are
+    released by a timer on the audio engine thread, where every other player
+    command runs.
+    """
+
+    def __init__(self, engine, player_factory, catalog, max_standby=2, idle_timeout=600, prebuffer=True,
+                 resolve=None):
+        self.engine = engine
+        self.player_factory = player_factory
+        self.resolve = resolve
+        self.catalog = catalog
+        self.max_standby = max_standby
+        self.idle_timeout = idle_timeout
+        self.prebuffer = prebuffer
+        self._entries = {}
+        self._recent = list(PRESET_KEYS)
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._evict_timer = engine.call_later(self._evict_interval(), self._evict_idle)
+
+    def warm(self, exclude_key=None):
+        """Start standby players for the most recently used presets, up to the cap."""
+        presets = self.catalog.presets
+        with self._lock:
+            # Drop standbys whose preset URL changed or that are now playing
+            for key, entry in list(self._entries.items()):
+                if key == exclude_key or presets.get(key) != entry.url:
+                    self._release(self._entries.pop(key))
+
+            for key in self._recent:
+                if len(self._entries) >= self.max_standby:
+                    break
+                url = presets.get(key)
+                if key == exclude_key or key in self._entries or not url:
+                    continue
+                self._entries[key] = self._start(key, url)
+
+    def take(self, key, url):
+        """Hand over the standby player for key, or None if there is no matching standby."""
+        with self._lock:
+            self._touch(key)
+            entry = self._entries.get(key)
+            if entry is None or entry.url != url:
+                return None
+            del self._entries[key]
+        if not self.prebuffer:
+            entry.player.play()
+        return entry
+
+    def offer(self, key, url, player):
+        """Keep the previously audible player as a standby if there is room, else stop and release it."""
+        with self._lock:
+            self._touch(key)
+            if key and url and key not in self._entries and len(self._entries) < self.max_standby:
+                player.audio_set_mute(True)
+                entry = StandbyEntry(key, url, player)
+                entry.ready = True
+                self._entries[key] = entry
+                return True
+        player.stop()
+        player.release()
+        return False
+
+    def stop(self):
+        """Release every standby player."""
+        self._evict_timer.cancel()
+        with self._lock:
+            self._stopped = True
+            for entry in self._entries.values():
+                self._release(entry)
+            self._entries.clear()
+
+    def _touch(self, key):
+        if key in self._entries:
+            self._entries[key].last_used = time.monotonic()
+        if key in self._recent:
+            self._recent.remove(key)
+        self._recent.insert(0, key)
+
+    def _start(self, key, url):
+        player = self.player_factory()
+        entry = StandbyEntry(key, url, player)
+        media = player.get_instance().media_new(self.resolve(url) if self.resolve else url)
+        player.set_media(media)
+
+        if self.prebuffer:
+            def on_buffering(event):
+                if event.u.new_cache >= 100:
+                    entry.ready = True
+
+            player.event_manager().event_attach(vlc.EventType.MediaPlayerBuffering, on_buffering)
+            player.audio_set_mute(True)
+            player.play()
+        else:
+            media.parse_with_options(vlc.MediaParseFlag.network, 5000)
+        print(f"Standby player started for {key}: {url}")
+        return entry
+
+    def _release(self, entry):
+        print(f"Releasing standby player for {entry.key}")
+        entry.player.stop()
+        entry.player.release()
+
+    def _evict_interval(self):
+        return min(60, self.idle_timeout)
+
+    def _evict_idle(self):
+        # Runs on the engine thread, so it cannot race a take() or warm() there
+        now = time.monotonic()
+        with self._lock:
+            if self._stopped:
+                return
+            for key, entry in list(self._entries.items()):
+                if now - entry.last_used > self.idle_timeout:
+                    self._release(self._entries.pop(key))
+        self._evict_timer = self.engine.call_later(self._evict_interval(), self._evict_idle)
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+
+PREVIEW_SECONDS = 30
+MAX_PREVIEWS = 1  # Previews playing at once; starting another stops the oldest
+
+
+class PreviewManager:
+    """Plays station previews on dedicated players and stops them on the engine's timer heap.
+
+    All methods run on the audio engine thread (StreamManager calls them
+    through engine.call), so no locking is needed. Each preview has one
+    cancellable timer; stopping or replacing a preview cancels it, so a stale
+    timer can never stop a newer preview. on_stop() is called after a preview
+    stops, but not when one is replaced to make room for another.
+
+    `newest` is the only attribute meant for other threads: a (url, ends_at)
+    tuple that is replaced whole whenever the previews change.
+    """
+
+    def __init__(self, engine, resolve=None, on_stop=None, max_previews=MAX_PREVIEWS, duration=PREVIEW_SECONDS):
+        self.engine = engine
+        self.resolve = resolve
+        self.on_stop = on_stop
+        self.max_previews = max_previews
+        self.duration = duration
+        self._idle_players = [engine.player('preview')]
+        self._active = OrderedDict()  # url -> (player, ends_at, timer), oldest first
+        self.newest = (None, None)
+
+    @property
+    def url(self):
+        """The newest preview's station URL, or None."""
+        return self.newest[0]
+
+    @property
+    def ends_at(self):
+        """Monotonic time at which the newest preview stops, or None."""
+        return self.newest[1]
+
+    def is_playing(self, url):
+        return url in self._active
+
+    def start(self, url, volume):
+        """Preview url for `duration` seconds, restarting it if it is already playing."""
+        self._release(url)
+        while len(self._active) >= self.max_previews:
+            self._release(next(iter(self._active)))
+
+        player = self._idle_players.pop() if self._idle_players else self.engine.new_player()
+        player.set_media(self.engine.media(self.resolve(url) if self.resolve else url))
+        player.play()
+        player.audio_set_volume(volume)
+        timer = self.engine.call_later(self.duration, self.stop, url)
+        self._active[url] = (player, time.monotonic() + self.duration, timer)
+        self.newest = (url, self._active[url][1])
+
+    def stop(self, url):
+        """Stop the preview of url if it is playing."""
+        if self._release(url) and self.on_stop:
+            self.on_stop()
+
+    def stop_all(self):
+        """Stop every preview, e.g. because a preset was pressed."""
+        stopped = False
+        for url in list(self._active):
+            stopped = self._release(url) or stopped
+        if stopped and self.on_stop:
+            self.on_stop()
+
+    def set_volume(self, volume):
+        for player, _, _ in self._active.values():
+            player.audio_set_volume(volume)
+
+    def _release(self, url):
+        entry = self._active.pop(url, None)
+        if entry is None:
+            return False
+        player, _, timer = entry
+        timer.cancel()
+        player.stop()
+        self._idle_players.append(player)
+        url = next(reversed(self._active), None)
+        self.newest = (url, self._active[url][1] if url else None)
+        return True
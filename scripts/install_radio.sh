@@ -136,6 +136,7 @@ setup_python_env() {
         "python-vlc==3.0.21203"
         "pigpio==1.78"
         "toml==0.10.2"
+        "waitress==2.1.2"
     )
     
     for package in "${PACKAGES[@]}"; do
@@ -1,36 +1,31 @@
+import json
 import subprocess
 import time
+import urllib.request
 from datetime import datetime
-import re
 
-def get_current_station():
+NOW_PLAYING_URL = 'http://127.0.0.1:5000/api/now-playing'
+
+def get_now_playing():
+    """Fetch the radio's now-playing state from its web API; None if it does not answer."""
     try:
-        # Load config to get station names
-        with open('/home/radio/internetRadio/config.toml', 'r') as f:
-            config = f.read()
-            links = re.findall(r'name = "(.*?)"', config)
-            urls = re.findall(r'url = "(.*?)"', config)
-            stations = dict(zip(urls, links))
+        with urllib.request.urlopen(NOW_PLAYING_URL, timeout=2) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
 
-        # Get currently playing URL from service status
-        status = subprocess.check_output(['systemctl', 'status', 'internetradio']).decode()
-        for url in stations.keys():
-            if url in status:
-                # Check if stream is playing or paused
-                vlc_status = subprocess.check_output(['ps', 'aux']).decode()
-                is_playing = 'vlc' in vlc_status and url in vlc_status
-                state = "Playing" if is_playing else "Paused"
-                return f"{stations[url]} ({state})"
-        return "No station playing"
-    except:
+def get_current_station(now_playing):
+    if now_playing is None:
         return "Unable to determine current station"
+    if not now_playing['playing']:
+        return "No station playing"
+    state = "Paused" if now_playing['paused'] else now_playing['state'].capitalize()
+    title = f" - {now_playing['title']}" if now_playing['title'] else ""
+    return f"{now_playing['name'] or now_playing['url']} ({state}){title}"
 
-def get_service_status():
-    try:
-        status = subprocess.check_output(['systemctl', 'is-active', 'internetradio']).decode().strip()
-        return "✓ Running" if status == "active" else "✗ Stopped"
-    except:
-        return "✗ Error"
+def get_service_status(now_playing):
+    # The web API answering means the service is up
+    return "✓ Running" if now_playing is not None else "✗ Not responding"
 
 def get_recent_logs(num_lines=10):
     try:
@@ -53,13 +48,20 @@ def main():
         print(f"Last Updated: {now}")
         print("-" * 50)
         
+        now_playing = get_now_playing()
+
         # Service Status
-        status = get_service_status()
+        status = get_service_status(now_playing)
         print(f"Service Status: {status}")
         
         # Current Station
-        current = get_current_station()
+        current = get_current_station(now_playing)
         print(f"Current Station: {current}")
+        if now_playing and now_playing['history']:
+            print("Recent Tracks:")
+            for track in now_playing['history'][:5]:
+                started = datetime.fromtimestamp(track['started_at']).strftime("%H:%M")
+                print(f"  {started}  {track['title']}")
         print("-" * 50)
         
         # Recent Logs (last 10 entries, newest first)
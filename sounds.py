@@ -1,23 +1,184 @@
 import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+
 import vlc
 
+from audio_engine import get_engine
+
+try:
+    import alsaaudio
+except ImportError:  # pyalsaaudio is optional; cues fall back to the VLC cue player
+    alsaaudio = None
+
+CUE_DEVICE = 'plughw:2,0'  # Same headphone device VLC plays to
+PERIOD_FRAMES = 256  # ~6 ms at 44.1 kHz
+DUCK_LEVEL = 0.3
+VLC_START_TIMEOUT = 1.0  # Seconds to wait for the VLC cue player to report Playing
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class Cue:
+    """A sound decoded into memory: raw PCM frames plus their format."""
+
+    def __init__(self, path, channels, rate, sample_width, frames):
+        self.path = path
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.frames = frames
+        self.media = None
+
+    @property
+    def duration(self):
+        return len(self.frames) / (self.rate * self.channels * self.sample_width)
+
+
+def load_wav(path):
+    """Read a PCM WAV file (including WAVE_FORMAT_EXTENSIBLE, which the wave module rejects)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError(f"{path} is not a WAV file")
+    fmt = frames = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack('<4sI', data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + size]
+        if chunk_id == b'fmt ':
+            fmt = body
+        elif chunk_id == b'data':
+            frames = body
+        offset += 8 + size + (size & 1)
+    if fmt is None or frames is None:
+        raise ValueError(f"{path} has no fmt or data chunk")
+
+    format_tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+    if format_tag != WAVE_FORMAT_PCM:
+        raise ValueError(f"{path} is not PCM (format {format_tag:#x})")
+    return Cue(path, channels, rate, bits // 8, frames)
+
+
 class SoundManager:
-    def __init__(self, folder_path):
+    """Plays short UI cues that were decoded once at startup.
+
+    Cues are written straight to ALSA in small periods when pyalsaaudio is
+    available, otherwise they go through the engine's VLC cue player using a
+    media object created up front. ALSA is tried again for every cue, since
+    the device may only be busy while a stream is playing. While a cue plays,
+    duck(level) is called to dip the stream and duck(1.0) restores it
+    afterwards.
+    """
+
+    def __init__(self, folder_path, engine=None, duck=None, device=CUE_DEVICE):
         self.folder_path = folder_path
-        self.player = vlc.MediaPlayer()
+        self.engine = engine or get_engine()
+        self.player = self.engine.player('cue')
+        self.duck = duck
+        self.device = device if alsaaudio is not None else None
+        self.cue_latencies = deque(maxlen=50)  # (sound_file, seconds) from trigger to first audio out
+        self.cues = {}
+        self._alsa_busy = False  # Last ALSA open failed; logged once until it works again
+        self._vlc_playing = threading.Event()
+        self.player.event_manager().event_attach(vlc.EventType.MediaPlayerPlaying,
+                                                 lambda event: self._vlc_playing.set())
+        self._queue = queue.Queue()
+        self._preload()
+        threading.Thread(target=self._run, name='sound-cues', daemon=True).start()
+
+    def _preload(self):
+        if not os.path.isdir(self.folder_path):
+            print(f"Sound folder not found: {self.folder_path}")
+            return
+        for name in sorted(os.listdir(self.folder_path)):
+            if name.lower().endswith('.wav'):
+                path = os.path.join(self.folder_path, name)
+                try:
+                    cue = load_wav(path)
+                except (OSError, ValueError) as e:
+                    print(f"Could not load sound {path}: {e}")
+                    continue
+                cue.media = self.engine.media(path)
+                self.cues[name] = cue
 
     def play_sound(self, sound_file):
-        """Play a sound file from the folder."""
-        sound_path = os.path.join(self.folder_path, sound_file)
-        if os.path.isfile(sound_path):
-            print(f"Playing sound: {sound_path}")
-            media = vlc.Media(sound_path)
-            self.player.set_media(media)
-            self.player.play()
+        """Play a preloaded sound from the folder."""
+        if sound_file in self.cues:
+            print(f"Playing sound: {sound_file}")
+            self._queue.put((sound_file, time.monotonic()))
         else:
-            print(f"Sound file not found: {sound_path}")
+            print(f"Sound file not found: {os.path.join(self.folder_path, sound_file)}")
 
     def stop_sound(self):
         """Stop the currently playing sound."""
-        self.player.stop()
+        self.engine.submit(self.player.stop)
+
+    def _run(self):
+        while True:
+            sound_file, triggered_at = self._queue.get()
+            cue = self.cues[sound_file]
+            self._set_duck(DUCK_LEVEL)
+            try:
+                if self.device:
+                    try:
+                        self._play_alsa(sound_file, cue, triggered_at)
+                        self._alsa_busy = False
+                        continue
+                    except alsaaudio.ALSAAudioError as e:
+                        # Usually the device is held while a stream plays; only this cue goes through VLC
+                        if not self._alsa_busy:
+                            print(f"ALSA cue output unavailable, using VLC until it frees up: {e}")
+                        self._alsa_busy = True
+                self._play_vlc(sound_file, cue, triggered_at)
+            except Exception as e:
+                print(f"Error playing sound {sound_file}: {e}")
+            finally:
+                self._set_duck(1.0)
+
+    def _play_alsa(self, sound_file, cue, triggered_at):
+        formats = {1: alsaaudio.PCM_FORMAT_U8, 2: alsaaudio.PCM_FORMAT_S16_LE,
+                   3: alsaaudio.PCM_FORMAT_S24_3LE, 4: alsaaudio.PCM_FORMAT_S32_LE}
+        pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, device=self.device, channels=cue.channels,
+                            rate=cue.rate, format=formats[cue.sample_width], periodsize=PERIOD_FRAMES)
+        try:
+            chunk = PERIOD_FRAMES * cue.channels * cue.sample_width
+            for start in range(0, len(cue.frames), chunk):
+                pcm.write(cue.frames[start:start + chunk])
+                if start == 0:
+                    self._record_latency(sound_file, triggered_at)
+            # Let the last periods drain before the stream comes back up
+            time.sleep(min(0.1, cue.duration))
+        finally:
+            pcm.close()
+
+    def _play_vlc(self, sound_file, cue, triggered_at):
+        def play():
+            self._vlc_playing.clear()
+            self.player.set_media(cue.media)
+            self.player.play()
+        self.engine.call(play)
+        # Latency runs to VLC's Playing event, when output starts, not to the play() call
+        if self._vlc_playing.wait(VLC_START_TIMEOUT):
+            self._record_latency(sound_file, triggered_at)
+        else:
+            print(f"Cue {sound_file} did not start within {VLC_START_TIMEOUT}s")
+        time.sleep(cue.duration)
+
+    def _set_duck(self, level):
+        if self.duck:
+            try:
+                self.duck(level)
+            except Exception as e:
+                print(f"Error ducking stream: {e}")
 
+    def _record_latency(self, sound_file, triggered_at):
+        latency = time.monotonic() - triggered_at
+        self.cue_latencies.append((sound_file, latency))
+        print(f"Cue {sound_file} started in {latency * 1000:.0f} ms")
@@ -0,0 +1,259 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import toml
+
+CONFIG_PATH = '/home/radio/internetRadio/config.toml'
+PRESET_KEYS = ('link1', 'link2', 'link3')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SHORT_PREFIX_LENGTH = 2  # Query words up to this long use a prebuilt position list
+
+_TOKEN_RE = re.compile(r'\w+')
+
+_shared_catalogs = {}
+_shared_lock = threading.Lock()
+
+
+class StationCatalog:
+    """Parsed view of config.toml that is only re-read when the file changes."""
+
+    def __init__(self, config_path=CONFIG_PATH):
+        self.config_path = config_path
+        self._lock = threading.Lock()
+        self._signature = ()
+        self._config = {}
+        self._presets = {}
+        self._links = []
+        self._url_to_name = {}
+        self._index = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self):
+        """Re-parse the config file if its mtime or size changed."""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            try:
+                config = toml.load(self.config_path)
+            except (OSError, toml.TomlDecodeError) as e:
+                # Keep serving the last good parse until the file changes again
+                print(f"Error loading station catalog: {e}")
+                config = self._config
+
+            links = [link for link in config.get('links', []) if link.get('url')]
+            self._config = config
+            self._presets = {key: config.get(key, '') for key in PRESET_KEYS}
+            self._links = links
+            self._url_to_name = {link['url']: link.get('name', '') for link in links}
+            self._index = None
+            self._signature = signature
+
+    @property
+    def config(self):
+        """The full parsed config dictionary."""
+        self._refresh()
+        return self._config
+
+    @property
+    def presets(self):
+        """Mapping of preset keys (link1..link3) to stream URLs."""
+        self._refresh()
+        return dict(self._presets)
+
+    @property
+    def links(self):
+        """The [[links]] station entries with a URL."""
+        self._refresh()
+        return self._links
+
+    @property
+    def url_to_name(self):
+        """Prebuilt mapping of stream URL to station name."""
+        self._refresh()
+        return self._url_to_name
+
+    @property
+    def index(self):
+        """Search indexes over the [[links]] entries, rebuilt when the file changes."""
+        self._refresh()
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = StationIndex(self._links)
+                index = self._index
+        return index
+
+    def get(self, key, default=''):
+        """Return the value of a top-level config key such as a preset."""
+        self._refresh()
+        if key in self._presets:
+            return self._presets[key] or default
+        return self._config.get(key, default)
+
+    def set_preset(self, key, url):
+        """Update a preset in memory ahead of the config file being rewritten."""
+        self._refresh()
+        with self._lock:
+            self._presets[key] = url
+            self._config = dict(self._config, **{key: url})
+
+    def name_for_url(self, url, default="Unknown Channel"):
+        """Return the station name for a stream URL."""
+        self._refresh()
+        return self._url_to_name.get(url, default)
+
+    def preset_name(self, key, default="Unknown Channel"):
+        """Return the station name of the preset stored under key."""
+        return self.name_for_url(self.get(key), default)
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+class StationIndex:
+    """Prebuilt name, country, location and token indexes for paginated station search.
+
+    Stations are kept sorted by name and every index stores positions into that
+    order, so a page is produced by walking one index from the cursor and stopping
+    once the page is full.
+    """
+
+    def __init__(self, links):
+        self.stations = sorted(links, key=lambda link: ((link.get('name') or '').lower(), link.get('url')))
+        self._names = [(link.get('name') or '').lower() for link in self.stations]
+        self._countries = [(link.get('country') or '').lower() for link in self.stations]
+        self._locations = [(link.get('location') or '').lower() for link in self.stations]
+        self._station_tokens = []
+        self._by_country = {}
+        self._by_location = {}
+        token_positions = {}
+        short_prefix_positions = {}
+
+        for pos, link in enumerate(self.stations):
+            self._by_country.setdefault(self._countries[pos], []).append(pos)
+            self._by_location.setdefault(self._locations[pos], []).append(pos)
+            tokens = set(_tokens(link.get('name')))
+            tokens.update(_tokens(link.get('country')))
+            tokens.update(_tokens(link.get('location')))
+            self._station_tokens.append(tokens)
+            for token in tokens:
+                token_positions.setdefault(token, []).append(pos)
+            # A one- or two-letter word matches a large share of all tokens, too many to merge per page
+            short_prefixes = {token[:length] for token in tokens for length in range(1, SHORT_PREFIX_LENGTH + 1)}
+            for short_prefix in short_prefixes:
+                short_prefix_positions.setdefault(short_prefix, []).append(pos)
+
+        self._token_list = sorted(token_positions)
+        self._token_positions = token_positions
+        self._short_prefix_positions = short_prefix_positions
+
+    def _matching_tokens(self, token_prefix):
+        start = bisect.bisect_left(self._token_list, token_prefix)
+        end = bisect.bisect_left(self._token_list, token_prefix + '\uffff', start)
+        for index in range(start, end):
+            yield self._token_list[index]
+
+    def _positions_from(self, positions, cursor):
+        # Indexes rather than a slice, so starting a page never copies the list
+        for index in range(bisect.bisect_left(positions, cursor), len(positions)):
+            yield positions[index]
+
+    def _token_candidates(self, token_prefix, cursor):
+        """Positions of stations with a word starting with token_prefix, in name order."""
+        if len(token_prefix) <= SHORT_PREFIX_LENGTH:
+            positions = self._short_prefix_positions.get(token_prefix, [])
+            return len(positions), self._positions_from(positions, cursor)
+        lists = [self._token_positions[token] for token in self._matching_tokens(token_prefix)]
+        estimate = sum(len(positions) for positions in lists)
+        merged = heapq.merge(*(self._positions_from(positions, cursor) for positions in lists))
+
+        def unique():
+            last = None
+            for pos in merged:
+                if pos != last:
+                    last = pos
+                    yield pos
+
+        return estimate, unique()
+
+    def search(self, query='', prefix='', country='', location='', cursor=0, limit=DEFAULT_PAGE_SIZE,
+               exclude=None):
+        """Return (stations, next_cursor) for one page of matching stations.
+
+        query matches word prefixes in the name, country or location, prefix matches
+        the start of the name, and country/location are exact (case-insensitive).
+        exclude(station) can drop further stations, e.g. ones known to be dead.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        cursor = max(0, int(cursor))
+        query_tokens = _tokens(query)
+        prefix = (prefix or '').lower()
+        country = (country or '').strip().lower()
+        location = (location or '').strip().lower()
+
+        # Drive the scan from the most selective index and check the rest per station
+        candidates = []
+        if prefix:
+            lo = bisect.bisect_left(self._names, prefix)
+            hi = bisect.bisect_left(self._names, prefix + '\uffff')
+            candidates.append((hi - lo, iter(range(max(lo, cursor), hi))))
+        if country:
+            positions = self._by_country.get(country, [])
+            candidates.append((len(positions), self._positions_from(positions, cursor)))
+        if location:
+            positions = self._by_location.get(location, [])
+            candidates.append((len(positions), self._positions_from(positions, cursor)))
+        if query_tokens:
+            candidates.append(self._token_candidates(query_tokens[0], cursor))
+        if candidates:
+            driver = min(candidates, key=lambda candidate: candidate[0])[1]
+        else:
+            driver = iter(range(cursor, len(self.stations)))
+
+        results = []
+        next_cursor = None
+        for pos in driver:
+            if prefix and not self._names[pos].startswith(prefix):
+                continue
+            if country and self._countries[pos] != country:
+                continue
+            if location and self._locations[pos] != location:
+                continue
+            if query_tokens and not all(
+                any(token.startswith(query_token) for token in self._station_tokens[pos])
+                for query_token in query_tokens
+            ):
+                continue
+            if exclude and exclude(self.stations[pos]):
+                continue
+            if len(results) == limit:
+                next_cursor = pos
+                break
+            results.append(self.stations[pos])
+
+        return results, next_cursor
+
+
+def get_catalog(config_path=CONFIG_PATH):
+    """Return the process-wide catalog for config_path."""
+    with _shared_lock:
+        catalog = _shared_catalogs.get(config_path)
+        if catalog is None:
+            catalog = StationCatalog(config_path)
+            _shared_catalogs[config_path] = catalog
+        return catalog
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from config_writer import atomic_write
+from station_catalog import get_catalog
+from stream_resolver import REDIRECT_STATUSES, USER_AGENT
+
+HEALTH_PATH = '/home/radio/internetRadio/station_health.json'
+MAX_HEADER_BYTES = 16 * 1024
+SAMPLE_BYTES = 4096
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+class StationHealthChecker:
+    """Probes every catalog station with asyncio and keeps the results on disk.
+
+    One pass opens up to `concurrency` connections at a time. For each station it
+    sends a GET with Icy-MetaData, follows redirects and reads the response
+    headers and the first audio bytes, recording reachability, time to first
+    byte, content type and ICY bitrate/name. Passes are incremental: only
+    stations whose result is older than recheck_interval (or failed_recheck_interval
+    for dead ones) are probed, at most batch_size per pass.
+    """
+
+    def __init__(self, catalog, path=HEALTH_PATH, concurrency=20, timeout=8, recheck_interval=6 * 3600,
+                 failed_recheck_interval=3600, batch_size=200, pass_interval=600):
+        self.catalog = catalog
+        self.path = path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.recheck_interval = recheck_interval
+        self.failed_recheck_interval = failed_recheck_interval
+        self.batch_size = batch_size
+        self.pass_interval = pass_interval
+        self.results = self._load()
+        self.last_pass = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Run incremental passes on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='station-health', daemon=True)
+            self._thread.start()
+        return self
+
+    def get(self, url):
+        with self._lock:
+            return self.results.get(url)
+
+    def is_dead(self, url):
+        """True only for stations whose last check failed; unchecked stations are not dead."""
+        result = self.get(url)
+        return result is not None and not result['ok']
+
+    def rank(self, url):
+        """Sort key: reachable stations by time to first byte, then unchecked, then dead."""
+        result = self.get(url)
+        if result is None:
+            return (1, 0)
+        if not result['ok']:
+            return (2, 0)
+        return (0, result['latency_ms'] or 0)
+
+    def summary(self):
+        with self._lock:
+            results = list(self.results.values())
+        return {
+            'checked': len(results),
+            'ok': sum(1 for result in results if result['ok']),
+            'dead': sum(1 for result in results if not result['ok']),
+            'last_pass': self.last_pass
+        }
+
+    def due_urls(self, now=None):
+        """Return the station URLs whose result is missing or stale, oldest first."""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            for link in self.catalog.links:
+                url = link['url']
+                result = self.results.get(url)
+                if result is None:
+                    due.append((0, url))
+                    continue
+                interval = self.recheck_interval if result['ok'] else self.failed_recheck_interval
+                if now - result['checked_at'] >= interval:
+                    due.append((result['checked_at'], url))
+        return [url for _, url in sorted(due)][:self.batch_size]
+
+    def run_pass(self, urls=None):
+        """Check urls (default: the due ones), store the results and return them."""
+        urls = self.due_urls() if urls is None else urls
+        if not urls:
+            return {}
+        started = time.monotonic()
+        results = asyncio.run(self.check_all(urls))
+        with self._lock:
+            self.results.update(results)
+            # Forget stations that left the catalog
+            known = {link['url'] for link in self.catalog.links}
+            self.results = {url: result for url, result in self.results.items() if url in known}
+            data = json.dumps(self.results, indent=1)
+        self.last_pass = {
+            'checked': len(results),
+            'ok': sum(1 for result in results.values() if result['ok']),
+            'seconds': round(time.monotonic() - started, 1),
+            'finished_at': time.time()
+        }
+        print(f"Station health pass: {self.last_pass['ok']}/{len(results)} reachable in {self.last_pass['seconds']}s")
+        try:
+            atomic_write(self.path, data)
+        except OSError as e:
+            print(f"Error saving station health: {e}")
+        return results
+
+    async def check_all(self, urls):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(url):
+            async with semaphore:
+                return url, await self.check(url)
+
+        return dict(await asyncio.gather(*(bounded(url) for url in urls)))
+
+    async def check(self, url):
+        """Probe one station and return its health record."""
+        started = time.monotonic()
+        result = {'ok': False, 'status': None, 'latency_ms': None, 'content_type': None, 'bitrate': None,
+                  'icy_name': None, 'final_url': None, 'error': None, 'checked_at': time.time()}
+        try:
+            await asyncio.wait_for(self._probe(url, result, started), self.timeout)
+        except asyncio.TimeoutError:
+            result['error'] = 'timeout'
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            result['error'] = str(e) or type(e).__name__
+        return result
+
+    async def _probe(self, url, result, started):
+        for _ in range(6):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise ValueError(f"unsupported scheme {parts.scheme!r}")
+            https = parts.scheme == 'https'
+            host = parts.hostname
+            reader, writer = await asyncio.open_connection(
+                host, parts.port or (443 if https else 80),
+                ssl=ssl.create_default_context() if https else None,
+                server_hostname=host if https else None,
+                limit=MAX_HEADER_BYTES
+            )
+            try:
+                path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+                writer.write(
+                    f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\nUser-Agent: {USER_AGENT}\r\n"
+                    f"Icy-MetaData: 1\r\nConnection: close\r\n\r\n".encode()
+                )
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                status, headers = _parse_head(head)
+                result['status'] = status
+                if status in REDIRECT_STATUSES and 'location' in headers:
+                    url = urljoin(url, headers['location'])
+                    continue
+                if status >= 400:
+                    raise ValueError(f"HTTP {status}")
+
+                sample = await reader.read(SAMPLE_BYTES)
+                if not sample:
+                    raise ValueError('no data')
+                result.update(
+                    ok=True,
+                    latency_ms=round((time.monotonic() - started) * 1000),
+                    content_type=headers.get('content-type'),
+                    bitrate=_int_or_none(headers.get('icy-br', '').split(',')[0]),
+                    icy_name=headers.get('icy-name'),
+                    final_url=url
+                )
+                return
+            finally:
+                writer.close()
+        raise ValueError('too many redirects')
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Error reading station health from {self.path}: {e}")
+            return {}
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pass()
+            except Exception as e:
+                print(f"Station health pass failed: {e}")
+            time.sleep(self.pass_interval)
+
+
+def _parse_head(head):
+    """Parse an HTTP or ICY ("ICY 200 OK") status line and headers."""
+    lines = head.decode('latin-1').split('\r\n')
+    status_line = lines[0].split(None, 2)
+    if len(status_line) < 2 or not status_line[0].startswith(('HTTP/', 'ICY')) or not status_line[1].isdigit():
+        raise ValueError(f"bad status line {lines[0]!r}")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return int(status_line[1]), headers
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def get_health_checker(catalog=None):
+    """Return the process-wide station health checker."""
+    global _checker
+    with _checker_lock:
+        if _checker is None:
+            _checker = StationHealthChecker(catalog or get_catalog())
+        return _checker
@@ -1,72 +1,436 @@
 import vlc
-import toml
 import time
-import threading
 import os
+from collections import deque
+
+from audio_engine import get_engine
+from station_catalog import get_catalog
+from preset_standby import PresetStandby
+from stream_supervisor import StreamSupervisor
+from player_events import PlayerState
+from stream_resolver import get_resolver
+from metrics import BUTTON_TO_AUDIO, STATION_SWITCH, SWITCH_GAP
+from timeshift import TimeshiftSession
+from now_playing import TrackHistory
+from preview import PreviewManager, MAX_PREVIEWS
+from crossfade import Crossfader, START_TIMEOUT, MIN_AVAILABLE_MB, available_memory_mb
 
 class StreamManager:
-    def __init__(self, volume):
+    def __init__(self, volume, catalog=None, engine=None, hot_presets=False, max_standby=2, standby_idle_timeout=600,
+                 resolver=None, timeshift_minutes=0, max_previews=MAX_PREVIEWS, crossfade_seconds=0):
         self.current_stream = None
-        self.config_path = '/home/radio/internetRadio/config.toml'
-        self.config = toml.load(self.config_path)
+        self.engine = engine or get_engine()
+        self.catalog = catalog or get_catalog()
+        self.config_path = self.catalog.config_path
+        self.resolver = resolver or get_resolver()
         self.current_key = None  # Track the current playing stream key
-        self.last_played_url = None  # Track the current playing stream key from preview
+        self.current_url = None
+        self.media_url = None  # What the main player actually opened (current_url after redirects/playlists)
+        self.now_playing = None
+        self.history = TrackHistory()  # Recent titles per preset URL
+        self.resume_key = None  # Preset to bring back when the preview ends
         self.volume = volume
+        self.duck_level = 1.0  # Lowered while a sound cue plays over the stream
+        self.timeshift_minutes = timeshift_minutes  # 0 plays stations directly
+        self.timeshift = None  # TimeshiftSession for the current preset
+        self.paused_at = None  # Buffer offset to resume from while paused
+        self.crossfade_seconds = crossfade_seconds  # 0 switches stations with a hard cut
+        self.switch_latencies = deque(maxlen=50)  # (stream_key, seconds, hot) per button press
+        self.switch_gaps = deque(maxlen=50)  # (stream_key, seconds of silence, mode) per switch
+        self._switch_started = None
+
+        # Players come from the shared audio engine; previews get their own players
+        self.player = self._watch_player(self.engine.player('main'))
+        self.previews = PreviewManager(self.engine, self.resolver.lookup, self._preview_stopped, max_previews)
+        self.crossfader = Crossfader(self.engine, crossfade_seconds)
+
+        self.standby = None
+        if hot_presets:
+            self.standby = PresetStandby(self.engine, self._new_player, self.catalog, max_standby,
+                                         standby_idle_timeout, resolve=self.resolver.lookup)
+
+        # Reconnects the preset stream when it errors or stalls
+        self.supervisor = StreamSupervisor(self).start()
+
+        # Published to the web UI as a JSON snapshot and as Server-Sent Events
+        self.player_state = PlayerState()
+        self.publish_state()
+
+    def _new_player(self):
+        return self._watch_player(self.engine.new_player())
+
+    def _set_main_player(self, player):
+        self.player = player
+        self.engine.players['main'] = player
+
+    def _watch_player(self, player):
+        """Forward buffering and failure events while this player is the audible one."""
+        def on_buffering(event):
+            if player is self.player:
+                if event.u.new_cache >= 100:
+                    self._record_first_audio()
+                    self.engine.submit(self.crossfader.begin, player)
+                self.supervisor.on_buffering(event.u.new_cache)
+                self.publish_state()
+
+        def on_failure(event):
+            if player is self.player:
+                self.supervisor.on_player_event(event.type)
+
+        events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerBuffering, on_buffering)
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError, on_failure)
+        events.event_attach(vlc.EventType.MediaPlayerEndReached, on_failure)
+        return player
+
+    def publish_state(self):
+        """Push the current player state to listeners if it changed."""
+        url = self.current_url
+        timeshift = self.timeshift  # Read once; _play_stream/_stop_stream may clear it on the engine thread
+        preview_url, preview_ends_at = self.previews.newest  # Swapped whole on the engine thread
+        self.player_state.update(
+            state=self.supervisor.state if self.current_key else 'stopped',
+            key=self.current_key,
+            url=url,
+            name=self.catalog.name_for_url(url) if url else None,
+            volume=self.volume,
+            title=self.now_playing,
+            preview_url=preview_url,
+            preview_ends_at=preview_ends_at,
+            paused=self.paused_at is not None,
+            timeshift_delay=round(timeshift.delay()) if timeshift else None
+        )
+
+    def _set_stream_media(self, stream_url, mrl=None):
+        """Load stream_url (resolved if cached, or mrl if given) into the main player and follow its now-playing metadata."""
+        self.media_url = mrl or self.resolver.lookup(stream_url)
+        media = self.engine.media(self.media_url)
+        self._follow_now_playing(stream_url, media)
+        self.player.set_media(media)
+
+    def _follow_now_playing(self, stream_url, media):
+        """Take titles from VLC's NowPlaying meta while media is on the main player."""
+        def on_meta_changed(event):
+            if self.player.get_media() is media:
+                self._on_title(stream_url, media.get_meta(vlc.Meta.NowPlaying))
+
+        media.event_manager().event_attach(vlc.EventType.MediaMetaChanged, on_meta_changed)
+        self.now_playing = None
 
-        # Create VLC instance with explicit audio output and device
-        instance = vlc.Instance('--aout=alsa', '--alsa-audio-device=plughw:2,0')  # Use Headphones device
-        self.player = instance.media_player_new()
+    def _on_title(self, stream_url, title):
+        """Record a title heard on stream_url and publish it if that stream is still playing."""
+        if title and stream_url == self.current_url and title != self.now_playing:
+            self.now_playing = title
+            self.history.record(stream_url, title)
+            self.publish_state()
+
+    def resolve_presets(self):
+        """Resolve the preset URLs in the background so the next press skips redirects and playlists."""
+        self.resolver.prefetch(self.catalog.presets.values())
+
+    def warm_presets(self):
+        """Start the hot-preset standby players once the network is up."""
+        if self.standby:
+            self.engine.call(self.standby.warm, exclude_key=self.current_key)
+
+    def _record_first_audio(self):
+        started = self._switch_started
+        if started is None:
+            return
+        self._switch_started = None
+        stream_key, started_at, mode = started
+        latency = time.monotonic() - started_at
+        self.switch_latencies.append((stream_key, latency, mode == 'hot'))
+        BUTTON_TO_AUDIO.observe(latency, mode)
+        print(f"Button to first audio for {stream_key}: {latency * 1000:.0f} ms ({mode})")
+
+        # The old station stays audible through a crossfade unless it had already dropped out
+        outgoing = self.crossfader.outgoing
+        gap = 0.0 if mode == 'crossfade' and outgoing is not None and outgoing.is_playing() else latency
+        self.switch_gaps.append((stream_key, gap, mode))
+        SWITCH_GAP.observe(gap, mode)
+        print(f"Audible gap switching to {stream_key}: {gap * 1000:.0f} ms ({mode})")
 
     def play_stream(self, stream_key):
-        self.config = toml.load(self.config_path)
         """Play the radio stream associated with the given key."""
-        stream_url = self.config.get(stream_key, '')
+        self.engine.call(self._play_stream, stream_key)
+
+    def _play_stream(self, stream_key):
+        stream_url = self.catalog.get(stream_key, '')
         if stream_url:
-            print(f"Starting stream: {stream_url}")
-            # Set the media to the player
-            media = vlc.Media(stream_url)
-            self.player.set_media(media)
-            self.player.play()
-            self.player.audio_set_volume(self.volume)
+            started_at = time.monotonic()
+            entry = self.standby.take(stream_key, stream_url) if self.standby and not self.timeshift_minutes else None
+            crossfade = self._crossfade_allowed()
+            mode = 'crossfade' if crossfade else 'hot' if entry else 'cold'
+            self._switch_started = (stream_key, started_at, mode)
+            self.resume_key = None  # A pressed preset wins over the one a preview interrupted
+            self.previews.stop_all()
+            if crossfade:
+                print(f"Crossfading to stream: {stream_url}")
+                self._crossfade_to(stream_url, entry)
+            elif entry:
+                print(f"Switching to standby stream: {stream_url}")
+                self.crossfader.finish()
+                previous_player, previous_key = self.player, self.current_key
+                self._adopt_standby(entry, stream_url)
+                self.player.audio_set_volume(self._output_volume())
+                self.player.audio_set_mute(False)
+                if entry.ready:
+                    self._record_first_audio()
+                self.standby.offer(previous_key, self.catalog.get(previous_key, '') if previous_key else '', previous_player)
+            elif self.timeshift_minutes:
+                print(f"Starting timeshifted stream: {stream_url}")
+                previous = self.timeshift
+                self.timeshift = TimeshiftSession(self.resolver.lookup(stream_url), self.timeshift_minutes,
+                                                  on_title=lambda title: self._on_title(stream_url, title))
+                self.paused_at = None
+                self._set_stream_media(stream_url, self.timeshift.live_url())
+                self.player.play()
+                self.player.audio_set_volume(self._output_volume())
+                if previous:
+                    previous.close()
+            else:
+                print(f"Starting stream: {stream_url}")
+                self.crossfader.finish()
+                # Set the media to the player
+                self._set_stream_media(stream_url)
+                self.player.play()
+                self.player.audio_set_volume(self._output_volume())
             self.current_key = stream_key
+            self.current_url = stream_url
+            self.supervisor.stream_started(stream_url)
+            if entry and entry.ready:
+                self.supervisor.stream_ready(stream_url)
+            self.resolver.prefetch([stream_url])  # Refreshes the cached target once it expires
+            if self.standby:
+                self.standby.warm(exclude_key=stream_key)
+            self.publish_state()
+            STATION_SWITCH.observe(time.monotonic() - started_at, mode)
+
+    def _adopt_standby(self, entry, stream_url):
+        """Make a standby player the main one."""
+        self._set_main_player(entry.player)
+        self.media_url = self.resolver.lookup(stream_url)
+        media = self.player.get_media()
+        self._follow_now_playing(stream_url, media)
+        # The standby player has been reading metadata while it warmed up
+        self.now_playing = media.get_meta(vlc.Meta.NowPlaying)
+        self.history.record(stream_url, self.now_playing)
+
+    def _crossfade_allowed(self):
+        """Crossfade only away from a playing preset, and only with memory to spare for a second player."""
+        if not self.crossfade_seconds or self.timeshift_minutes or not self.current_key or not self.player.is_playing():
+            return False
+        available = available_memory_mb()
+        if available is not None and available < MIN_AVAILABLE_MB:
+            print(f"Only {available:.0f} MB of memory available, switching without a crossfade")
+            return False
+        return True
+
+    def _crossfade_to(self, stream_url, entry):
+        """Buffer stream_url on a second player while the current one plays, then fade across."""
+        previous_player, previous_key = self.player, self.current_key
+        if entry:
+            self._adopt_standby(entry, stream_url)
+        else:
+            self._set_main_player(self._new_player())
+            self._set_stream_media(stream_url)
+        self.crossfader.prepare(previous_player, self.player, self._output_volume(),
+                                lambda player: self._retire_player(previous_key, player))
+        if entry:
+            self.player.audio_set_mute(False)
+        else:
+            self.player.play()
+        if entry and entry.ready:
+            self._record_first_audio()
+            self.crossfader.begin(self.player)
+        else:
+            self.engine.call_later(START_TIMEOUT, self._crossfade_timeout, self.player)
+
+    def _crossfade_timeout(self, player):
+        if self.crossfader.incoming is player and not self.crossfader.fading:
+            print(f"New station silent after {START_TIMEOUT}s, cutting over without a crossfade")
+            self.crossfader.finish()
+
+    def _retire_player(self, stream_key, player):
+        """Keep a player that has been faded out as a standby for stream_key, or release it."""
+        stream_url = self.catalog.get(stream_key, '') if stream_key else ''
+        if self.standby:
+            self.standby.offer(stream_key, stream_url, player)
+        else:
+            player.stop()
+            player.release()
+
+    def restart_stream(self):
+        """Reconnect the current preset stream from scratch."""
+        self.engine.call(self._restart_stream)
+
+    def _restart_stream(self):
+        if self.timeshift:
+            # The ingest thread reconnects upstream on its own; only reopen the local feed
+            if self.paused_at is None:
+                self._play_timeshift(self.timeshift.url_at(self.timeshift.position))
+        elif self.current_key and self.current_url:
+            if self.media_url != self.current_url:
+                # The cached target may be stale; go back to the station's own URL
+                print(f"Falling back to original stream URL: {self.current_url}")
+                self.resolver.invalidate(self.current_url)
+            self._set_stream_media(self.current_url)
+            self.player.play()
+            self.player.audio_set_volume(self._output_volume())
+
+    def read_bytes(self):
+        """Return how many bytes the current stream has read so far, or None."""
+        return self.engine.call(self._read_bytes)
+
+    def _read_bytes(self):
+        media = self.player.get_media() if self.current_key else None
+        if media is None:
+            return None
+        stats = vlc.MediaStats()
+        if not media.get_stats(stats):
+            return None
+        return stats.read_bytes
 
     def stop_stream(self):
         """Stop the currently playing stream."""
+        self.engine.call(self._stop_stream)
+
+    def _stop_stream(self):
         if self.current_key:
             print(f"Stopping stream.")
-            self.player.stop()
+            self.crossfader.finish()
+            if self.standby and not self.timeshift:
+                # Keep the stream buffered but muted so pressing the button again is instant
+                self.standby.offer(self.current_key, self.catalog.get(self.current_key, ''), self.player)
+                self._set_main_player(self._new_player())
+            else:
+                self.player.stop()
+            self._close_timeshift()
             self.current_key = None
+            self.current_url = None
+            self.media_url = None
+            self.now_playing = None
+            self.supervisor.stream_stopped()
+            self.publish_state()
+
+    def pause_stream(self):
+        """Pause a timeshifted stream; the station keeps recording into the buffer."""
+        return self.engine.call(self._pause_stream)
+
+    def _pause_stream(self):
+        if not self.timeshift or self.paused_at is not None:
+            return False
+        self.paused_at = self.timeshift.position
+        self.player.stop()
+        self.supervisor.stream_stopped()
+        self.publish_state()
+        return True
+
+    def resume_stream(self):
+        """Resume a paused timeshifted stream from where it was paused."""
+        return self.engine.call(self._resume_stream)
+
+    def _resume_stream(self):
+        if not self.timeshift or self.paused_at is None:
+            return False
+        offset, self.paused_at = self.paused_at, None
+        self._play_timeshift(self.timeshift.url_at(offset))
+        return True
+
+    def jump_back(self, seconds=30):
+        """Replay the timeshifted stream from `seconds` before the current position."""
+        return self.engine.call(self._jump_back, seconds)
+
+    def _jump_back(self, seconds):
+        if not self.timeshift:
+            return False
+        if self.paused_at is not None:
+            self.timeshift.position = self.paused_at
+        self.paused_at = None
+        self._play_timeshift(self.timeshift.url_at(self.timeshift.offset_back(seconds)))
+        return True
+
+    def go_live(self):
+        """Return a timeshifted stream to the live edge."""
+        return self.engine.call(self._go_live)
+
+    def _go_live(self):
+        if not self.timeshift:
+            return False
+        self.paused_at = None
+        self._play_timeshift(self.timeshift.live_url())
+        return True
+
+    def _play_timeshift(self, mrl):
+        self._set_stream_media(self.current_url, mrl)
+        self.timeshift.title = None  # The session reports the title again once the player reads from mrl
+        self.player.play()
+        self.player.audio_set_volume(self._output_volume())
+        self.supervisor.stream_started(self.current_url)
+        self.publish_state()
+
+    def _close_timeshift(self):
+        if self.timeshift:
+            self.timeshift.close()
+            self.timeshift = None
+        self.paused_at = None
 
     def set_volume(self, volume):
         """Set the volume of the player."""
+        self.engine.call(self._set_volume, volume)
+
+    def _set_volume(self, volume):
         if self.current_key:
             # Ensure the volume is within VLC's acceptable range (0-100)
             volume = max(0, min(volume, 100))
             self.volume = volume
             print(f"Setting volume to: {self.volume}")
-            self.player.audio_set_volume(self.volume)
+            self._apply_output_volume()
+            self.publish_state()
+
+    def duck(self, level):
+        """Scale the audible volume by level (1.0 restores it) without changing the set volume."""
+        self.engine.call(self._duck, level)
+
+    def _duck(self, level):
+        self.duck_level = level
+        self._apply_output_volume()
+        self.previews.set_volume(self._output_volume())
+
+    def _apply_output_volume(self):
+        if self.crossfader.active:
+            self.crossfader.set_volume(self._output_volume())
+        else:
+            self.player.audio_set_volume(self._output_volume())
+
+    def _output_volume(self):
+        return round(self.volume * self.duck_level)
 
     def play_stream_radio(self, stream_url):
         """Preview the radio stream."""
+        self.engine.call(self._play_stream_radio, stream_url)
+
+    def _play_stream_radio(self, stream_url):
         if stream_url:
-            if self.last_played_url == stream_url:
-                self.player.stop() 
-                self.last_played_url = None  
-            else:
-                if self.player.is_playing():
-                    self.player.stop()  
-
-                print(f"Starting new stream: {stream_url}")
-                media = vlc.Media(stream_url)
-                self.player.set_media(media)
-                self.player.play()  
-                self.player.audio_set_volume(self.volume)
-                self.last_played_url = stream_url  
-
-                threading.Thread(target=self.stop_stream_after_delay, args=(30,)).start()
-
-    def stop_stream_after_delay(self, delay):
-        """Stop the stream after a specified delay."""
-        time.sleep(delay)  
-        self.player.stop()  
-        self.last_played_url = None  
\ No newline at end of file
+            if self.previews.is_playing(stream_url):
+                # A second click on the same station ends its preview
+                self.previews.stop(stream_url)
+                return
+            if self.current_key:
+                # Never let a preview play over the preset stream; it comes back afterwards
+                self.resume_key = self.current_key
+                self._stop_stream()
+
+            print(f"Starting new stream: {stream_url}")
+            self.previews.start(stream_url, self._output_volume())
+            self.publish_state()
+
+    def _preview_stopped(self):
+        """Called by the previews on the engine thread after one stops."""
+        if self.previews.url is None and self.resume_key:
+            stream_key, self.resume_key = self.resume_key, None
+            print(f"Preview over, resuming {stream_key}")
+            self._play_stream(stream_key)
+        else:
+            self.publish_state()
@@ -0,0 +1,334 @@
+import collections
+import http.client
+import queue
+import selectors
+import socket
+import threading
+import time
+
+from metrics import RELAY_DROPPED
+from now_playing import IcyReader
+from stream_resolver import open_stream
+
+RELAY_PORT = 5002
+ICY_METAINT = 16000
+MAX_BACKLOG_BYTES = 256 * 1024  # Per listener; slower listeners are dropped
+READ_BYTES = 8192
+MAX_UPSTREAM_FAILURES = 5  # Consecutive failures before listeners are dropped
+
+
+def icy_metadata_block(title):
+    """Encode a StreamTitle as an ICY metadata block (length byte plus padded text)."""
+    if title is None:
+        return b'\0'
+    text = f"StreamTitle='{title.replace(chr(39), chr(96))}';".encode('utf-8')[:255 * 16]
+    length = -(-len(text) // 16)
+    return bytes([length]) + text.ljust(length * 16, b'\0')
+
+
+class StreamRelay:
+    """Relays the playing preset to LAN listeners over one upstream connection.
+
+    An upstream thread follows PlayerState's url and is only connected while
+    someone listens. Its chunks are shared, not copied: each listener queues
+    memoryviews of the same bytes objects and a single selector thread writes
+    them out. A listener that falls MAX_BACKLOG_BYTES behind is disconnected so
+    it cannot hold up the others. Clients sending Icy-MetaData: 1 get the
+    current title interleaved every ICY_METAINT bytes.
+
+    A listener's response headers are sent with the first chunk of the
+    station, so its Content-Type is the upstream's. When the station changes
+    every listener is disconnected rather than fed a second stream under the
+    first one's headers; players reconnect and get the new one.
+    """
+
+    def __init__(self, player_state, resolve=None, host='0.0.0.0', port=RELAY_PORT, path='/listen',
+                 metaint=ICY_METAINT, max_backlog=MAX_BACKLOG_BYTES, max_clients=32):
+        self.player_state = player_state
+        self.resolve = resolve
+        self.host = host
+        self.port = port
+        self.path = path
+        self.metaint = metaint
+        self.max_backlog = max_backlog
+        self.max_clients = max_clients
+        self.url = None
+        self.title = None
+        self.content_type = 'audio/mpeg'
+        self.listener_count = 0
+        self.dropped = 0
+        self._title_version = 0
+        self._meta_block = icy_metadata_block(None)
+        self._selector = selectors.DefaultSelector()
+        self._messages = queue.Queue()
+        self._clients = {}
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wanted = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Bind the port and start the relay threads."""
+        if self._thread is None:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.port))
+            server.listen(16)
+            server.setblocking(False)
+            self.port = server.getsockname()[1]
+            self._selector.register(server, selectors.EVENT_READ, 'accept')
+            self._wake_reader.setblocking(False)
+            self._selector.register(self._wake_reader, selectors.EVENT_READ, 'wake')
+            self.player_state.subscribe(self._on_state)
+            self._on_state(self.player_state.snapshot())
+            self._thread = threading.Thread(target=self._run, name='stream-relay', daemon=True)
+            self._thread.start()
+            threading.Thread(target=self._upstream, name='stream-relay-upstream', daemon=True).start()
+        return self
+
+    def stats(self):
+        return {'url': self.url, 'listeners': self.listener_count, 'dropped': self.dropped, 'title': self.title}
+
+    def _on_state(self, snapshot):
+        with self._wanted:
+            changed = snapshot['url'] != self.url
+            if changed:
+                self.url = snapshot['url']
+                self._wanted.notify_all()
+        if changed:
+            self._post(('station', snapshot['url']))
+
+    def _post(self, message):
+        self._messages.put(message)
+        try:
+            self._wake_writer.send(b'\0')
+        except OSError:
+            pass
+
+    # Upstream thread
+
+    def _upstream(self):
+        attempts = 0
+        while True:
+            with self._wanted:
+                self._wanted.wait_for(lambda: self.url and self.listener_count > 0)
+                url = self.url
+            try:
+                self._relay_from(url)
+                attempts = 0
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                attempts += 1
+                if attempts >= MAX_UPSTREAM_FAILURES:
+                    print(f"Relay upstream {url} failed {attempts} times ({e}), dropping listeners")
+                    attempts = 0
+                    self._post(('end', None))
+                    # Start again only for new listeners or another station
+                    with self._wanted:
+                        self._wanted.wait_for(lambda: self.listener_count == 0 or self.url != url, 5)
+                    continue
+                delay = min(30, 2 ** (attempts - 1))
+                print(f"Relay upstream {url} failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _relay_from(self, station_url):
+        url = self.resolve(station_url) if self.resolve else station_url
+        response, connection = open_stream(url)
+        try:
+            self.content_type = response.getheader('Content-Type', 'audio/mpeg')
+            reader = IcyReader(response, int(response.getheader('icy-metaint') or 0),
+                               on_title=lambda title: self._post(('title', (station_url, title))))
+            # Stop when the station changes or the last listener leaves
+            while self.url == station_url and self.listener_count > 0:
+                data = reader.read1(READ_BYTES)
+                if not data:
+                    raise ValueError('stream ended')
+                # Tagged with the station so a chunk read just before a switch is not sent after it
+                self._post(('chunk', (station_url, data)))
+        finally:
+            connection.close()
+
+    # Selector thread
+
+    def _run(self):
+        while True:
+            for key, mask in self._selector.select():
+                if key.data == 'accept':
+                    self._accept(key.fileobj)
+                elif key.data == 'wake':
+                    self._drain_messages()
+                else:
+                    if mask & selectors.EVENT_READ:
+                        self._read(key.fileobj)
+                    if mask & selectors.EVENT_WRITE and key.fileobj in self._clients:
+                        self._write(key.fileobj)
+
+    def _accept(self, server):
+        try:
+            sock, _ = server.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        self._clients[sock] = {'request': bytearray(), 'streaming': False, 'out': collections.deque(),
+                               'backlog': 0, 'icy': False, 'until_meta': self.metaint, 'title_version': 0}
+        self._selector.register(sock, selectors.EVENT_READ, 'client')
+
+    def _read(self, sock):
+        client = self._clients[sock]
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(sock)
+            return
+        if client['streaming']:
+            return
+        client['request'] += data
+        if b'\r\n\r\n' not in client['request']:
+            if len(client['request']) > 8192:
+                self._close(sock)
+            return
+
+        head = bytes(client['request']).decode('latin-1').split('\r\n')
+        parts = head[0].split()
+        path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+        headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in head[1:])}
+        if parts[:1] != ['GET'] or path != self.path:
+            self._respond_and_close(sock, '404 Not Found')
+        elif self.url is None:
+            self._respond_and_close(sock, '503 Service Unavailable')
+        elif self.listener_count >= self.max_clients:
+            self._respond_and_close(sock, '503 Service Unavailable')
+        else:
+            # Headers go out with the first chunk, once the upstream content type is known
+            client['streaming'] = True
+            client['head_sent'] = False
+            client['icy'] = headers.get('icy-metadata') == '1'
+            self._set_listener_count(self.listener_count + 1)
+
+    def _response_head(self, client):
+        response = (
+            'HTTP/1.0 200 OK\r\n'
+            f'Content-Type: {self.content_type}\r\n'
+            'Cache-Control: no-cache\r\n'
+            f'icy-name: {self.player_state.snapshot()["name"] or "Radio"}\r\n'
+        )
+        if client['icy']:
+            response += f'icy-metaint: {self.metaint}\r\n'
+        return (response + '\r\n').encode('latin-1', errors='replace')
+
+    def _respond_and_close(self, sock, status):
+        client = self._clients[sock]
+        self._queue(sock, client, f"HTTP/1.0 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+        client['close_after_write'] = True
+
+    def _drain_messages(self):
+        try:
+            while self._wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                kind, value = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'chunk':
+                station_url, data = value
+                if station_url == self.url:
+                    self._broadcast(data)
+            elif kind == 'title':
+                station_url, title = value
+                if station_url == self.url:
+                    self._set_title(title)
+            elif kind in ('end', 'station'):
+                if kind == 'station':
+                    self._set_title(None)
+                for sock, client in list(self._clients.items()):
+                    if client['streaming']:
+                        self._close(sock)
+
+    def _set_title(self, title):
+        self.title = title
+        self._title_version += 1
+        self._meta_block = icy_metadata_block(title)
+
+    def _broadcast(self, chunk):
+        view = memoryview(chunk)
+        for sock, client in list(self._clients.items()):
+            if not client['streaming']:
+                continue
+            if not client['head_sent']:
+                client['head_sent'] = True
+                head = self._response_head(client)
+                client['out'].append(memoryview(head))
+                client['backlog'] += len(head)
+            if client['icy']:
+                self._queue_with_metadata(client, view)
+            else:
+                client['out'].append(view)
+                client['backlog'] += len(view)
+            if client['backlog'] > self.max_backlog:
+                self.dropped += 1
+                RELAY_DROPPED.inc()
+                self._close(sock)
+            else:
+                self._write(sock)
+
+    def _queue_with_metadata(self, client, view):
+        while view:
+            part = view[:client['until_meta']]
+            client['out'].append(part)
+            client['backlog'] += len(part)
+            client['until_meta'] -= len(part)
+            view = view[len(part):]
+            if client['until_meta'] == 0:
+                # Only send the title again when it changed
+                block = self._meta_block if client['title_version'] != self._title_version else b'\0'
+                client['title_version'] = self._title_version
+                client['out'].append(memoryview(block))
+                client['backlog'] += len(block)
+                client['until_meta'] = self.metaint
+
+    def _queue(self, sock, client, data):
+        client['out'].append(memoryview(data))
+        client['backlog'] += len(data)
+        self._write(sock)
+
+    def _write(self, sock):
+        client = self._clients[sock]
+        out = client['out']
+        while out:
+            try:
+                sent = sock.send(out[0])
+            except BlockingIOError:
+                break
+            except OSError:
+                self._close(sock)
+                return
+            client['backlog'] -= sent
+            if sent < len(out[0]):
+                out[0] = out[0][sent:]
+                break
+            out.popleft()
+        if not out and client.get('close_after_write'):
+            self._close(sock)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if out else 0)
+        self._selector.modify(sock, events, 'client')
+
+    def _close(self, sock):
+        client = self._clients.pop(sock, None)
+        if client and client['streaming']:
+            self._set_listener_count(self.listener_count - 1)
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+
+    def _set_listener_count(self, count):
+        with self._wanted:
+            self.listener_count = count
+            self._wanted.notify_all()
@@ -0,0 +1,225 @@
+import configparser
+import http.client
+import queue
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+USER_AGENT = 'internetRadio/1.0'
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_PLAYLIST_BYTES = 64 * 1024
+PLAYLIST_TYPES = {
+    'audio/x-scpls': 'pls',
+    'audio/scpls': 'pls',
+    'audio/x-mpegurl': 'm3u',
+    'audio/mpegurl': 'm3u',
+    'application/x-mpegurl': 'm3u',
+    'application/vnd.apple.mpegurl': 'm3u'
+}
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+class IcyResponse(http.client.HTTPResponse):
+    """HTTPResponse that also accepts SHOUTcast v1's "ICY 200 OK" status line."""
+
+    def _read_status(self):
+        line = str(self.fp.readline(http.client._MAXLINE + 1), 'iso-8859-1')
+        if not line:
+            raise http.client.RemoteDisconnected('Remote end closed connection without response')
+        if line.startswith('ICY '):
+            # ICY responses are HTTP/1.0-style: headers, then the stream until close
+            line = 'HTTP/1.0 ' + line[4:]
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/') or not parts[1].isdigit():
+            raise http.client.BadStatusLine(line)
+        return parts[0], int(parts[1]), parts[2].strip() if len(parts) > 2 else ''
+
+
+def open_stream(url, timeout=15, max_redirects=5, icy_metadata=True):
+    """GET a stream, following redirects; returns (response, connection) for the caller to close.
+
+    Works with SHOUTcast v1 servers as well, and asks for interleaved ICY
+    metadata unless icy_metadata is False. response.url is the URL that
+    answered after any redirects.
+    """
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise OSError(f"unsupported URL scheme in {url}")
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        connection.response_class = IcyResponse
+        try:
+            path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+            connection.request('GET', path, headers={'User-Agent': USER_AGENT,
+                                                     'Icy-MetaData': '1' if icy_metadata else '0'})
+            response = connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+        if response.status in REDIRECT_STATUSES:
+            location = response.getheader('Location')
+            connection.close()
+            if not location:
+                raise OSError(f"redirect without Location from {url}")
+            url = urljoin(url, location)
+            continue
+        if response.status >= 400:
+            connection.close()
+            raise OSError(f"HTTP {response.status} from {url}")
+        response.url = url
+        return response, connection
+    raise OSError(f"too many redirects for {url}")
+
+
+def playlist_kind(url, content_type):
+    """Return 'pls', 'm3u' or None from the URL's extension or the response content type."""
+    path = urlsplit(url).path.lower()
+    if path.endswith('.pls'):
+        return 'pls'
+    if path.endswith(('.m3u', '.m3u8')):
+        return 'm3u'
+    return PLAYLIST_TYPES.get((content_type or '').split(';')[0].strip().lower())
+
+
+def parse_playlist(kind, body, base_url):
+    """Return the first stream URL in a playlist, or None if there is none to expand to.
+
+    HLS playlists (#EXT-X- tags) list segments rather than streams, so they are
+    left for VLC to play as they are.
+    """
+    text = body.decode('utf-8', errors='replace')
+    if kind == 'pls':
+        parser = configparser.ConfigParser(strict=False, interpolation=None)
+        try:
+            parser.read_string(text)
+        except configparser.Error:
+            return None
+        section = next((name for name in parser.sections() if name.lower() == 'playlist'), None)
+        if section is None:
+            return None
+        entries = sorted((key for key in parser[section] if key.startswith('file')),
+                         key=lambda key: int(key[4:]) if key[4:].isdigit() else 0)
+        return urljoin(base_url, parser[section][entries[0]].strip()) if entries else None
+
+    if '#EXT-X-' in text:
+        return None
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            return urljoin(base_url, line)
+    return None
+
+
+class StreamResolver:
+    """Resolves station URLs to the media URL VLC should open and caches the answer.
+
+    Redirect chains are followed and .pls/.m3u/.m3u8 playlists expanded, so a
+    play only pays for them when nothing is cached. Results are kept for ttl
+    seconds; failures are cached for negative_ttl seconds so a dead station is
+    not retried on every press. Resolution happens on one background thread;
+    lookup() never touches the network.
+    """
+
+    def __init__(self, ttl=3600, negative_ttl=60, timeout=5, max_redirects=5, max_depth=3):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_depth = max_depth
+        self._cache = {}  # url -> (target or None, expires_at, error)
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def lookup(self, url):
+        """Return the cached media URL for url, or url itself when nothing usable is cached."""
+        with self._lock:
+            entry = self._cache.get(url)
+        if entry and entry[0] and entry[1] > time.monotonic():
+            return entry[0]
+        return url
+
+    def resolve(self, url):
+        """Resolve url now (blocking) unless a fresh result is cached; returns the media URL."""
+        with self._lock:
+            entry = self._cache.get(url)
+        if entry and entry[1] > time.monotonic():
+            return entry[0] or url
+
+        target, error = None, None
+        try:
+            target = self._resolve(url, 0)
+        except (OSError, http.client.HTTPException) as e:
+            error = str(e)
+            print(f"Could not resolve stream {url}: {e}")
+        with self._lock:
+            ttl = self.ttl if target else self.negative_ttl
+            self._cache[url] = (target, time.monotonic() + ttl, error)
+        return target or url
+
+    def prefetch(self, urls):
+        """Queue urls for background resolution."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stream-resolver', daemon=True)
+                self._thread.start()
+            for url in urls:
+                if url and url not in self._pending:
+                    self._pending.add(url)
+                    self._queue.put(url)
+
+    def invalidate(self, url):
+        """Forget the cached target for url, e.g. after it failed to play."""
+        with self._lock:
+            self._cache.pop(url, None)
+
+    def stats(self):
+        """Return the cache contents for debugging."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                url: {'target': target, 'expires_in': round(expires_at - now), 'error': error}
+                for url, (target, expires_at, error) in self._cache.items()
+            }
+
+    def _run(self):
+        while True:
+            url = self._queue.get()
+            try:
+                self.resolve(url)
+            except Exception as e:
+                print(f"Stream resolver failed for {url}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
+
+    def _resolve(self, url, depth):
+        if urlsplit(url).scheme not in ('http', 'https'):
+            return url
+        # The same opener the relay and timeshift use, so redirects and ICY servers are handled in one place
+        response, connection = open_stream(url, self.timeout, self.max_redirects, icy_metadata=False)
+        try:
+            url = response.url
+            kind = playlist_kind(url, response.getheader('Content-Type'))
+            if kind is None:
+                return url
+            target = parse_playlist(kind, response.read(MAX_PLAYLIST_BYTES), url)
+            if target is None:
+                return url
+            # Playlists sometimes point at further playlists or redirects
+            return self._resolve(target, depth + 1) if depth + 1 < self.max_depth else target
+        finally:
+            connection.close()
+
+
+def get_resolver():
+    """Return the process-wide stream resolver."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = StreamResolver()
+        return _resolver
@@ -0,0 +1,190 @@
+import random
+import threading
+import time
+
+import vlc
+
+from metrics import REBUFFERS, STREAM_FAILURES, STREAM_RECONNECT
+
+
+class StreamSupervisor:
+    """Watches the preset stream and reconnects it when it errors, ends or stalls.
+
+    Player events only set flags (they arrive on VLC's threads); a monitor
+    thread samples the media's bytes-read counter every check_interval seconds,
+    treats stall_timeout seconds without new bytes as a stall, and reconnects
+    with jittered exponential backoff.
+    """
+
+    def __init__(self, stream_manager, check_interval=1.0, stall_timeout=6, backoff_base=1,
+                 backoff_max=60, stable_after=30):
+        self.stream_manager = stream_manager
+        self.check_interval = check_interval
+        self.stall_timeout = stall_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.state = 'stopped'
+        self.station_stats = {}
+        self._lock = threading.Lock()
+        self._url = None
+        self._failure = None
+        self._filled = False
+        self._rebuffering = False
+        self._last_bytes = None
+        self._last_progress = None
+        self._playing_since = None
+        self._attempts = 0
+        self._reconnect_at = None
+        self._outage_started = None
+        self._thread = None
+
+    def start(self):
+        """Start the monitor thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stream-supervisor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stream_started(self, url):
+        """Reset the watch state for a stream that was just started by the user."""
+        with self._lock:
+            self._url = url
+            self._attempts = 0
+            self._reconnect_at = None
+            self._outage_started = None
+            self._reset_watch()
+            self.state = 'buffering'
+
+    def stream_ready(self, url):
+        """Mark a stream that was already buffered (a warm standby player) as playing.
+
+        Such a player never sends another Buffering 100% event, so without this
+        the state would stay 'buffering' and stall/rebuffer tracking never arm.
+        """
+        with self._lock:
+            if url == self._url:
+                self._mark_playing()
+
+    def stream_stopped(self):
+        with self._lock:
+            self._url = None
+            self._reconnect_at = None
+            self._outage_started = None
+            self.state = 'stopped'
+
+    def on_player_event(self, event_type):
+        """Called from VLC's event thread for errors and end-of-stream."""
+        with self._lock:
+            if self._url and self._failure is None:
+                self._failure = 'error' if event_type == vlc.EventType.MediaPlayerEncounteredError else 'ended'
+
+    def on_buffering(self, cache):
+        """Called from VLC's event thread with the buffer fill percentage."""
+        with self._lock:
+            if not self._url:
+                return
+            if cache >= 100:
+                self._mark_playing()
+            elif self._filled and not self._rebuffering:
+                self._rebuffering = True
+                self._playing_since = None
+                self.state = 'buffering'
+                self._station(self._url)['rebuffers'] += 1
+                REBUFFERS.inc()
+
+    def stats(self):
+        """Return the current state and per-station counters."""
+        catalog = self.stream_manager.catalog
+        with self._lock:
+            return {
+                'state': self.state,
+                'url': self._url,
+                'reconnect_attempts': self._attempts,
+                'stations': {
+                    url: dict(counters, name=catalog.name_for_url(url))
+                    for url, counters in self.station_stats.items()
+                }
+            }
+
+    def _station(self, url):
+        return self.station_stats.setdefault(url, {
+            'failures': 0, 'stalls': 0, 'rebuffers': 0, 'reconnects': 0, 'last_failure': None
+        })
+
+    def _mark_playing(self):
+        self._filled = True
+        self._rebuffering = False
+        self.state = 'playing'
+        if self._playing_since is None:
+            self._playing_since = time.monotonic()
+        if self._outage_started is not None:
+            STREAM_RECONNECT.observe(time.monotonic() - self._outage_started)
+            self._outage_started = None
+
+    def _reset_watch(self):
+        self._failure = None
+        self._filled = False
+        self._rebuffering = False
+        self._last_bytes = None
+        self._last_progress = time.monotonic()
+        self._playing_since = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self._check()
+            except Exception as e:
+                print(f"Stream supervisor check failed: {e}")
+
+    def _check(self):
+        if not self._url:
+            return
+        read_bytes = self.stream_manager.read_bytes()
+        now = time.monotonic()
+        reconnect = False
+        with self._lock:
+            if not self._url:
+                return
+
+            if self._reconnect_at is not None:
+                if now >= self._reconnect_at:
+                    self._reconnect_at = None
+                    reconnect = True
+            else:
+                if read_bytes is not None and read_bytes != self._last_bytes:
+                    self._last_bytes = read_bytes
+                    self._last_progress = now
+                elif self._failure is None and now - self._last_progress > self.stall_timeout:
+                    self._failure = 'stall'
+                    self._station(self._url)['stalls'] += 1
+
+                if self._playing_since is not None and now - self._playing_since > self.stable_after:
+                    self._attempts = 0
+
+                if self._failure is not None:
+                    self._schedule_reconnect(now)
+
+            url = self._url
+
+        if reconnect:
+            print(f"Reconnecting stream {url} (attempt {self._attempts})")
+            self.stream_manager.restart_stream()
+        self.stream_manager.publish_state()
+
+    def _schedule_reconnect(self, now):
+        counters = self._station(self._url)
+        counters['failures'] += 1
+        counters['reconnects'] += 1
+        counters['last_failure'] = self._failure
+        STREAM_FAILURES.inc(self._failure)
+        if self._outage_started is None:
+            self._outage_started = now
+        delay = min(self.backoff_max, self.backoff_base * 2 ** self._attempts)
+        delay *= random.uniform(0.5, 1.5)
+        print(f"Stream {self._failure} on {self._url}, reconnecting in {delay:.1f}s")
+        self._attempts += 1
+        self._reconnect_at = now + delay
+        self.state = 'reconnecting'
+        self._reset_watch()
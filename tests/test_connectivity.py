@@ -0,0 +1,91 @@
+import http.server
+import socket
+import threading
+import time
+
+import pytest
+
+from connectivity import ConnectivityProber
+
+
+class _NoContentHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _NoContentHandler)
+    httpd.daemon_threads = True
+    httpd.requests = 0
+    httpd.delay = 0
+    httpd.status = 204
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/generate_204"
+
+
+def test_http_probe_measures_rtt(server):
+    prober = ConnectivityProber(_url(server))
+    assert prober.check()
+    snapshot = prober.snapshot()
+    assert snapshot['connected'] and snapshot['rtt_ms'] is not None and snapshot['error'] is None
+
+
+def test_result_is_cached_for_ttl(server):
+    prober = ConnectivityProber(_url(server), ttl=60)
+    assert prober.check() and prober.check()
+    assert server.requests == 1
+    assert prober.check(max_age=0)
+    assert server.requests == 2
+
+
+def test_concurrent_callers_share_one_probe(server):
+    server.delay = 0.3
+    prober = ConnectivityProber(_url(server))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(prober.check())) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == [True] * 10
+    assert server.requests == 1
+
+
+def test_unexpected_status_is_a_failure(server):
+    server.status = 200
+    prober = ConnectivityProber(_url(server))
+    assert not prober.check()
+    assert 'unexpected status 200' in prober.snapshot()['error']
+
+
+def test_closed_port_reports_disconnected():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    prober = ConnectivityProber(f"127.0.0.1:{port}", timeout=1)
+    assert not prober.check()
+    assert prober.snapshot()['error']
+
+
+def test_bad_target_fails_without_blocking_later_callers():
+    prober = ConnectivityProber('127.0.0.1:abc')
+    assert not prober.check()
+    assert 'ValueError' in prober.snapshot()['error']
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (prober.check(max_age=0), done.set()), daemon=True).start()
+    assert done.wait(2), 'second check hung waiting on a probe that never finished'
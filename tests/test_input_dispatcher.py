@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from input_dispatcher import InputDispatcher
+
+
+class Recorder:
+    def __init__(self):
+        self.presses = []
+        self.volume_changes = []
+        self.called = threading.Event()
+
+    def press(self, key):
+        self.presses.append(key)
+        self.called.set()
+
+    def volume(self, delta):
+        self.volume_changes.append(delta)
+        self.called.set()
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def _dispatcher(recorder, **kwargs):
+    return InputDispatcher(recorder.press, recorder.volume, **kwargs)
+
+
+def test_presses_in_one_frame_collapse_to_the_latest(recorder):
+    dispatcher = _dispatcher(recorder)
+    dispatcher._dispatch([('press', 'link1', 0.0), ('press', 'link3', 0.01), ('press', 'link2', 0.02)])
+    assert recorder.presses == ['link2']
+
+
+def test_slow_detents_move_one_step_each(recorder):
+    dispatcher = _dispatcher(recorder, step=5)
+    dispatcher._dispatch([('rotate', 1, 0.0), ('rotate', 1, 0.2), ('rotate', 1, 0.4)])
+    assert recorder.volume_changes == [15]
+
+
+def test_fast_spin_is_accelerated_into_one_change(recorder):
+    dispatcher = _dispatcher(recorder, step=5, accel_steps=((0.03, 3), (0.08, 2)))
+    batch = [('rotate', 1, 0.0), ('rotate', 1, 0.01), ('rotate', 1, 0.02), ('rotate', 1, 0.07)]
+    dispatcher._dispatch(batch)
+    # First detent has no predecessor, two come within 30 ms, the last within 80 ms
+    assert recorder.volume_changes == [5 + 15 + 15 + 10]
+
+
+def test_opposite_detents_cancel_out(recorder):
+    dispatcher = _dispatcher(recorder, step=5)
+    dispatcher._dispatch([('rotate', 1, 0.0), ('rotate', -1, 0.5)])
+    assert recorder.volume_changes == []
+
+
+def test_burst_from_gpio_threads_runs_once_per_frame(recorder):
+    dispatcher = _dispatcher(recorder, frame=0.1).start()
+    for key in ('link1', 'link2', 'link3'):
+        dispatcher.press(key)
+    for _ in range(10):
+        dispatcher.rotate(-1)
+    assert recorder.called.wait(2)
+    time.sleep(0.05)
+    assert recorder.presses == ['link3']
+    assert len(recorder.volume_changes) == 1 and recorder.volume_changes[0] < -10
+
+    stats = dispatcher.stats()
+    assert stats['count'] == 2
+    assert stats['max_ms'] >= 100  # Includes the frame spent gathering the burst
+
+
+def test_failing_action_does_not_stop_the_dispatcher(recorder):
+    def press(key):
+        recorder.press(key)
+        if key == 'link1':
+            raise RuntimeError('stream failed')
+
+    dispatcher = InputDispatcher(press, recorder.volume, frame=0.01).start()
+    dispatcher.press('link1')
+    assert recorder.called.wait(2)
+    recorder.called.clear()
+    dispatcher.press('link2')
+    assert recorder.called.wait(2)
+    assert recorder.presses == ['link1', 'link2']
+
+
+def test_mock_gpio_pins_feed_the_dispatcher(recorder):
+    gpiozero = pytest.importorskip('gpiozero')
+    from gpiozero.pins.mock import MockFactory
+
+    factory = MockFactory()
+    dispatcher = _dispatcher(recorder, frame=0.05).start()
+    # Wired the way main.setup_gpio wires the real pins
+    button1 = gpiozero.Button(17, pull_up=True, pin_factory=factory)
+    button2 = gpiozero.Button(27, pull_up=True, pin_factory=factory)
+    button1.when_pressed = lambda: dispatcher.press('link1')
+    button2.when_pressed = lambda: dispatcher.press('link2')
+    encoder = gpiozero.RotaryEncoder(5, 6, max_steps=1, wrap=False, pin_factory=factory)
+    encoder.when_rotated_clockwise = lambda rotation: dispatcher.rotate(1)
+    encoder.when_rotated_counter_clockwise = lambda rotation: dispatcher.rotate(-1)
+
+    button1.pin.drive_low()
+    button1.pin.drive_high()
+    button2.pin.drive_low()
+    for _ in range(3):
+        # One clockwise detent: A leads B through the quadrature cycle
+        for a, b in ((0, 1), (0, 0), (1, 0), (1, 1)):
+            encoder.a.pin.drive_high() if a else encoder.a.pin.drive_low()
+            encoder.b.pin.drive_high() if b else encoder.b.pin.drive_low()
+
+    assert recorder.called.wait(2)
+    time.sleep(0.1)
+    assert recorder.presses == ['link2']
+    assert sum(recorder.volume_changes) > 0
+    for device in (button1, button2, encoder):
+        device.close()
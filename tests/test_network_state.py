@@ -0,0 +1,113 @@
+import queue
+import threading
+
+from network_state import NetworkState
+
+
+class FakeNetworkManager:
+    """Stands in for nmcli: a queue of monitor lines plus canned query answers."""
+
+    def __init__(self, connection=None, device_state='disconnected', connectivity='none', modes=None):
+        self.lines = queue.Queue()
+        self.state = {'device_state': device_state, 'connection': connection, 'connectivity': connectivity}
+        self.modes = modes or {}
+        self.queries = 0
+        self.connection_queries = []
+
+    def events(self):
+        while True:
+            line = self.lines.get()
+            if line is None:
+                return
+            yield line
+
+    def query(self, interface):
+        self.queries += 1
+        return dict(self.state)
+
+    def connection_query(self, name):
+        self.connection_queries.append(name)
+        ssid, mode = self.modes.get(name, (name, 'infrastructure'))
+        return ssid, mode
+
+
+def _network_state(fake, **kwargs):
+    return NetworkState(event_source=fake.events, query=fake.query, connection_query=fake.connection_query,
+                        **kwargs)
+
+
+def test_initial_state_comes_from_query():
+    fake = FakeNetworkManager(connection='Home 1', device_state='connected', connectivity='full',
+                              modes={'Home 1': ('HomeNet', 'infrastructure')})
+    state = _network_state(fake)
+    state.refresh()
+    assert state.connected
+    assert state.snapshot()['ssid'] == 'HomeNet'
+    assert state.snapshot()['connectivity'] == 'full'
+
+
+def test_events_drive_connection_and_connectivity():
+    fake = FakeNetworkManager(modes={'Home 1': ('HomeNet', 'infrastructure')})
+    state = _network_state(fake).start()
+    assert not state.connected
+
+    fake.lines.put("wlan0: using connection 'Home 1'")
+    fake.lines.put('wlan0: connected')
+    fake.lines.put("Connectivity is now 'full'")
+    assert state.wait_for_connectivity(2)
+    assert state.ssid == 'HomeNet'
+    assert fake.queries == 1  # Only the initial refresh; events need no queries
+
+    fake.lines.put('wlan0: disconnected')
+    with state._condition:
+        assert state._condition.wait_for(lambda: not state.connected, 2)
+    assert state.ssid is None and state.connection is None
+    fake.lines.put(None)
+
+
+def test_connection_details_are_queried_once_per_connection():
+    fake = FakeNetworkManager()
+    state = _network_state(fake)
+    for line in ("wlan0: using connection 'Cafe'", 'wlan0: connected', "wlan0: using connection 'Cafe'"):
+        state.apply_event(line)
+    assert fake.connection_queries == ['Cafe']
+
+
+def test_own_access_point_is_not_a_client_connection():
+    fake = FakeNetworkManager(modes={'InternetRadio': ('InternetRadio', 'ap')})
+    state = _network_state(fake)
+    state.apply_event("wlan0: using connection 'InternetRadio'")
+    state.apply_event('wlan0: connected')
+    assert state.ap_mode and not state.connected
+    assert not state.wait_for_connection(0.1)
+
+
+def test_other_interfaces_are_ignored():
+    fake = FakeNetworkManager()
+    state = _network_state(fake)
+    state.apply_event('eth0: connected')
+    state.apply_event("eth0: using connection 'Wired'")
+    assert state.device_state == 'unknown' and state.connection is None
+
+
+def test_subscribers_hear_each_change_once():
+    fake = FakeNetworkManager()
+    state = _network_state(fake)
+    snapshots = []
+    state.subscribe(snapshots.append)
+    state.apply_event("Connectivity is now 'limited'")
+    state.apply_event("Connectivity is now 'limited'")
+    state.apply_event("Connectivity is now 'full'")
+    assert [snapshot['connectivity'] for snapshot in snapshots] == ['limited', 'full']
+
+
+def test_state_is_reread_when_the_event_source_ends():
+    fake = FakeNetworkManager()
+    state = _network_state(fake).start()
+    refreshed = threading.Event()
+    state.subscribe(lambda snapshot: snapshot['connected'] and refreshed.set())
+    # Something changed while the monitor was down; the restart must pick it up
+    fake.state = {'device_state': 'connected', 'connection': 'Home', 'connectivity': 'full'}
+    fake.lines.put(None)
+    assert refreshed.wait(5)
+    assert fake.queries == 2
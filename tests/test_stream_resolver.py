@@ -0,0 +1,186 @@
+import http.server
+import socket
+import threading
+import time
+
+import pytest
+
+import stream_resolver
+from stream_resolver import StreamResolver, parse_playlist
+
+
+class _RouteHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        status, headers, body = self.server.routes.get(self.path, (404, {}, b''))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _RouteHandler)
+    httpd.daemon_threads = True
+    httpd.routes = {}
+    httpd.hits = {}
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def icy_server():
+    """A SHOUTcast v1 server: answers "ICY 200 OK" and streams until the client leaves."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(4)
+
+    def serve():
+        while True:
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                return
+            with client:
+                client.recv(4096)
+                try:
+                    client.sendall(b'ICY 200 OK\r\ncontent-type: audio/mpeg\r\n\r\n' + b'\xff' * 4096)
+                except OSError:
+                    pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}/stream"
+    sock.close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _audio(body=b'\xff' * 64):
+    return 200, {'Content-Type': 'audio/mpeg'}, body
+
+
+def test_relative_redirects_are_followed(server):
+    server.routes['/listen'] = (302, {'Location': '/relay/listen'}, b'')
+    server.routes['/relay/listen'] = (301, {'Location': 'stream.mp3'}, b'')
+    server.routes['/relay/stream.mp3'] = _audio()
+    assert StreamResolver().resolve(server.base + '/listen') == server.base + '/relay/stream.mp3'
+
+
+def test_pls_and_m3u_playlists_are_expanded(server):
+    server.routes['/station.pls'] = (200, {'Content-Type': 'audio/x-scpls'},
+                                     b'[playlist]\nNumberOfEntries=2\nFile2=/b.mp3\nFile1=/a.mp3\n')
+    server.routes['/station.m3u'] = (200, {'Content-Type': 'audio/x-mpegurl'}, b'#EXTM3U\n\n/a.mp3\n/b.mp3\n')
+    server.routes['/a.mp3'] = _audio()
+    resolver = StreamResolver()
+    assert resolver.resolve(server.base + '/station.pls') == server.base + '/a.mp3'
+    assert resolver.resolve(server.base + '/station.m3u') == server.base + '/a.mp3'
+
+
+def test_playlist_pointing_at_a_redirect(server):
+    server.routes['/listen'] = (200, {'Content-Type': 'audio/x-mpegurl'}, b'/geo\n')
+    server.routes['/geo'] = (302, {'Location': '/edge/a.mp3'}, b'')
+    server.routes['/edge/a.mp3'] = _audio()
+    assert StreamResolver().resolve(server.base + '/listen') == server.base + '/edge/a.mp3'
+
+
+def test_hls_playlists_are_left_to_vlc(server):
+    server.routes['/live.m3u8'] = (200, {'Content-Type': 'application/vnd.apple.mpegurl'},
+                                   b'#EXTM3U\n#EXT-X-TARGETDURATION:6\nseg1.aac\n')
+    assert StreamResolver().resolve(server.base + '/live.m3u8') == server.base + '/live.m3u8'
+
+
+def test_icy_servers_are_already_the_stream(icy_server):
+    resolver = StreamResolver()
+    assert resolver.resolve(icy_server) == icy_server
+    assert resolver.stats()[icy_server]['error'] is None
+
+
+def test_results_are_cached_until_the_ttl_expires(server, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(stream_resolver, 'time', clock)
+    server.routes['/listen'] = (302, {'Location': '/a.mp3'}, b'')
+    server.routes['/a.mp3'] = _audio()
+    resolver = StreamResolver(ttl=60)
+    url = server.base + '/listen'
+
+    assert resolver.resolve(url) == server.base + '/a.mp3'
+    assert resolver.resolve(url) == server.base + '/a.mp3'
+    assert server.hits['/listen'] == 1
+    assert resolver.lookup(url) == server.base + '/a.mp3'
+
+    clock.now += 61
+    assert resolver.lookup(url) == url  # Stale entries are not handed out
+    resolver.resolve(url)
+    assert server.hits['/listen'] == 2
+
+
+def test_failures_are_negatively_cached(server, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(stream_resolver, 'time', clock)
+    resolver = StreamResolver(negative_ttl=30)
+    url = server.base + '/down'
+
+    assert resolver.resolve(url) == url  # Falls back to the station URL
+    assert 'HTTP 404' in resolver.stats()[url]['error']
+    server.routes['/down'] = (302, {'Location': '/a.mp3'}, b'')
+    server.routes['/a.mp3'] = _audio()
+    assert resolver.resolve(url) == url
+    assert server.hits['/down'] == 1
+
+    clock.now += 31
+    assert resolver.resolve(url) == server.base + '/a.mp3'
+
+
+def test_redirect_loops_fail(server):
+    server.routes['/loop'] = (302, {'Location': '/loop'}, b'')
+    resolver = StreamResolver(max_redirects=3)
+    url = server.base + '/loop'
+    assert resolver.resolve(url) == url
+    assert 'too many redirects' in resolver.stats()[url]['error']
+
+
+def test_invalidate_forgets_a_target_that_failed_to_play(server):
+    server.routes['/listen'] = (302, {'Location': '/a.mp3'}, b'')
+    server.routes['/a.mp3'] = _audio()
+    resolver = StreamResolver()
+    url = server.base + '/listen'
+    resolver.resolve(url)
+    resolver.invalidate(url)
+    assert resolver.lookup(url) == url
+
+
+def test_prefetch_resolves_in_the_background(server):
+    server.routes['/listen'] = (302, {'Location': '/a.mp3'}, b'')
+    server.routes['/a.mp3'] = _audio()
+    resolver = StreamResolver()
+    url = server.base + '/listen'
+    resolver.prefetch([url, url, None])
+    deadline = time.monotonic() + 5
+    while resolver.lookup(url) == url and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert resolver.lookup(url) == server.base + '/a.mp3'
+    assert server.hits['/listen'] == 1
+
+
+def test_non_http_urls_are_passed_through():
+    assert StreamResolver().resolve('rtsp://radio.example/live') == 'rtsp://radio.example/live'
+
+
+def test_parse_playlist_without_entries():
+    assert parse_playlist('pls', b'[playlist]\nNumberOfEntries=0\n', 'http://a/') is None
+    assert parse_playlist('m3u', b'#EXTM3U\n', 'http://a/') is None
@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+vlc = pytest.importorskip('vlc')
+
+import stream_supervisor
+from stream_supervisor import StreamSupervisor
+
+URL = 'http://radio.example/stream.mp3'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeCatalog:
+    def name_for_url(self, url):
+        return 'Test FM'
+
+
+class FakeStreamManager:
+    """Stands in for StreamManager: a byte counter the test advances and a log of restarts."""
+
+    def __init__(self):
+        self.catalog = FakeCatalog()
+        self.bytes = 0
+        self.restarts = 0
+        self.published = 0
+
+    def read_bytes(self):
+        return self.bytes
+
+    def restart_stream(self):
+        self.restarts += 1
+
+    def publish_state(self):
+        self.published += 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(stream_supervisor, 'time', clock)
+    monkeypatch.setattr(random, 'uniform', lambda low, high: 1.0)
+    return clock
+
+
+@pytest.fixture
+def manager():
+    return FakeStreamManager()
+
+
+def _supervisor(manager, **kwargs):
+    supervisor = StreamSupervisor(manager, stall_timeout=6, backoff_base=1, backoff_max=8, stable_after=30, **kwargs)
+    supervisor.stream_started(URL)
+    return supervisor
+
+
+def _run(supervisor, clock, seconds, manager=None, bytes_per_second=0):
+    for _ in range(int(seconds)):
+        clock.sleep(1)
+        if manager:
+            manager.bytes += bytes_per_second
+        supervisor._check()
+
+
+def test_buffering_then_playing(clock, manager):
+    supervisor = _supervisor(manager)
+    assert supervisor.state == 'buffering'
+    supervisor.on_buffering(40)
+    assert supervisor.state == 'buffering'
+    supervisor.on_buffering(100)
+    assert supervisor.state == 'playing'
+
+
+def test_flowing_stream_is_left_alone(clock, manager):
+    supervisor = _supervisor(manager)
+    supervisor.on_buffering(100)
+    _run(supervisor, clock, 20, manager, bytes_per_second=16000)
+    assert supervisor.state == 'playing'
+    assert manager.restarts == 0
+
+
+def test_stall_is_detected_and_reconnected(clock, manager):
+    supervisor = _supervisor(manager)
+    supervisor.on_buffering(100)
+    _run(supervisor, clock, 3, manager, bytes_per_second=16000)
+    _run(supervisor, clock, 7)  # Bytes stop arriving
+    assert supervisor.state == 'reconnecting'
+    counters = supervisor.stats()['stations'][URL]
+    assert counters['stalls'] == 1 and counters['last_failure'] == 'stall'
+
+    _run(supervisor, clock, 1)  # Backoff of backoff_base * 2**0 seconds
+    assert manager.restarts == 1
+
+
+def test_backoff_doubles_up_to_the_cap(clock, manager):
+    supervisor = _supervisor(manager)
+    delays = []
+    for _ in range(6):
+        supervisor.on_player_event(vlc.EventType.MediaPlayerEncounteredError)
+        supervisor._check()
+        delays.append(supervisor._reconnect_at - clock.now)
+        clock.now = supervisor._reconnect_at
+        supervisor._check()
+    assert delays == [1, 2, 4, 8, 8, 8]
+    assert manager.restarts == 6
+    assert supervisor.stats()['stations'][URL]['failures'] == 6
+
+
+def test_backoff_is_jittered(manager):
+    supervisor = _supervisor(manager)
+    supervisor.on_player_event(vlc.EventType.MediaPlayerEndReached)
+    supervisor._check()
+    delay = supervisor._reconnect_at - stream_supervisor.time.monotonic()
+    assert 0.4 <= delay <= 1.5
+    assert supervisor.stats()['stations'][URL]['last_failure'] == 'ended'
+
+
+def test_attempts_reset_after_stable_playback(clock, manager):
+    supervisor = _supervisor(manager)
+    supervisor.on_player_event(vlc.EventType.MediaPlayerEncounteredError)
+    _run(supervisor, clock, 2, manager, bytes_per_second=16000)
+    assert supervisor.stats()['reconnect_attempts'] == 1
+    supervisor.on_buffering(100)
+    _run(supervisor, clock, 31, manager, bytes_per_second=16000)
+    assert supervisor.stats()['reconnect_attempts'] == 0
+
+
+def test_rebuffer_is_counted_once_per_dip(clock, manager):
+    supervisor = _supervisor(manager)
+    supervisor.on_buffering(100)
+    supervisor.on_buffering(60)
+    supervisor.on_buffering(30)
+    assert supervisor.state == 'buffering'
+    supervisor.on_buffering(100)
+    assert supervisor.state == 'playing'
+    assert supervisor.stats()['stations'][URL]['rebuffers'] == 1
+
+
+def test_standby_stream_is_marked_ready(clock, manager):
+    supervisor = _supervisor(manager)
+    supervisor.stream_ready('http://other.example/')
+    assert supervisor.state == 'buffering'
+    supervisor.stream_ready(URL)
+    assert supervisor.state == 'playing'
+
+
+def test_stopped_stream_is_not_reconnected(clock, manager):
+    supervisor = _supervisor(manager)
+    supervisor.stream_stopped()
+    supervisor.on_player_event(vlc.EventType.MediaPlayerEncounteredError)
+    _run(supervisor, clock, 20)
+    assert supervisor.state == 'stopped'
+    assert manager.restarts == 0
@@ -0,0 +1,181 @@
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import timeshift
+from timeshift import RingBuffer, TimeshiftSession
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _metadata(title):
+    text = f"StreamTitle='{title}';".encode()
+    length = -(-len(text) // 16)
+    return bytes([length]) + text.ljust(length * 16, b'\0')
+
+
+@pytest.fixture
+def looping_station():
+    """Loops a numbered byte pattern forever, as a SHOUTcast v1 server with a title every 1000 bytes."""
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(4)
+    station = {'connections': 0}
+
+    def serve(client):
+        try:
+            client.recv(4096)
+            client.sendall(b'ICY 200 OK\r\ncontent-type: audio/aacp\r\nicy-metaint: 1000\r\n\r\n')
+            block = 0
+            while True:
+                client.sendall(bytes([block % 256]) * 1000 + _metadata(f'Track {block // 10}'))
+                block += 1
+                time.sleep(0.005)
+        except OSError:
+            pass
+        finally:
+            client.close()
+
+    def accept():
+        while True:
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                return
+            station['connections'] += 1
+            threading.Thread(target=serve, args=(client,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    station['url'] = f"http://127.0.0.1:{sock.getsockname()[1]}/stream"
+    yield station
+    sock.close()
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_ring_wraps_and_keeps_the_newest_bytes(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'ring'), 10)
+    ring.append(b'abcdefgh')
+    ring.append(b'ijklmn')
+    assert ring.written == 14 and ring.oldest == 4
+    assert ring.read(4, 100) == (4, b'efghijklmn')
+    assert ring.read(12, 100) == (12, b'mn')
+    ring.close()
+
+
+def test_overwritten_offsets_skip_forward(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'ring'), 8)
+    ring.append(b'0123456789abcdef')
+    assert ring.read(0, 4) == (8, b'89ab')
+    ring.close()
+
+
+def test_chunk_larger_than_the_ring(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'ring'), 4)
+    ring.append(b'xy')
+    ring.append(b'0123456789')
+    assert ring.written == 12
+    assert ring.read(0, 10) == (8, b'6789')
+    ring.close()
+
+
+def test_read_waits_for_data_and_times_out(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'ring'), 16)
+    assert ring.read(0, 4, timeout=0.05) == (0, b'')
+    threading.Timer(0.05, ring.append, (b'late',)).start()
+    assert ring.read(0, 4, timeout=2) == (0, b'late')
+    ring.close()
+
+
+def test_close_wakes_readers(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'ring'), 16)
+    threading.Timer(0.05, ring.close).start()
+    with pytest.raises(EOFError):
+        ring.read(0, 4, timeout=2)
+
+
+def test_backing_file_is_unlinked(tmp_path):
+    path = tmp_path / 'ring'
+    ring = RingBuffer(str(path), 16)
+    assert not path.exists()
+    ring.close()
+
+
+def test_time_index_maps_seconds_to_offsets(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(timeshift, 'time', clock)
+    ring = RingBuffer(str(tmp_path / 'ring'), 1000)
+    for second in range(5):
+        clock.now = 100.0 + second
+        ring.append(b'x' * 10)
+    assert ring.offset_at(102.5) == 30
+    assert ring.time_at(30) == 102.0
+    assert ring.offset_at(50.0) == 0  # Earlier than the buffer goes back
+    ring.close()
+
+
+def test_session_ingests_an_icy_station_and_serves_it(tmp_path, looping_station):
+    session = TimeshiftSession(looping_station['url'], minutes=0.01, path=str(tmp_path / 'ts'))
+    try:
+        assert _wait_for(lambda: session.buffer.written >= 20000)
+        assert session.content_type == 'audio/aacp'
+        assert session.error is None
+
+        # Metadata is cut out on ingest; the buffer holds only the looping pattern
+        offset, data = session.buffer.read(session.buffer.oldest, 5000)
+        assert all(data[i] == data[i - 1] or data[i] == (data[i - 1] + 1) % 256 for i in range(1, len(data)))
+
+        with urllib.request.urlopen(session.url_at(offset), timeout=5) as response:
+            assert response.headers['Content-Type'] == 'audio/aacp'
+            assert response.read(5000) == data
+    finally:
+        session.close()
+
+
+def test_titles_follow_playback_position(tmp_path, looping_station):
+    titles = []
+    session = TimeshiftSession(looping_station['url'], minutes=1, path=str(tmp_path / 'ts'), on_title=titles.append)
+    try:
+        assert _wait_for(lambda: len(session._titles) >= 3)
+        first_title_offset = session._title_offsets[0]
+        session.advance(first_title_offset)
+        assert session.title == 'Track 0'
+        session.advance(session.buffer.written)
+        assert session.title == session._titles[-1]
+        assert titles[0] == 'Track 0' and titles[-1] == session.title
+    finally:
+        session.close()
+
+
+def test_pause_keeps_one_upstream_connection(tmp_path, looping_station):
+    session = TimeshiftSession(looping_station['url'], minutes=1, path=str(tmp_path / 'ts'))
+    try:
+        with urllib.request.urlopen(session.live_url(), timeout=5) as response:
+            response.read(4096)
+        assert _wait_for(lambda: session.delay() > 0.3)  # "Paused": nobody is reading
+        written = session.buffer.written
+        assert _wait_for(lambda: session.buffer.written > written)
+        offset = session.offset_back(0.2)
+        assert offset < session.position
+        with urllib.request.urlopen(session.url_at(offset), timeout=5) as response:
+            assert response.read(4096)
+        assert looping_station['connections'] == 1
+    finally:
+        session.close()
@@ -0,0 +1,241 @@
+import bisect
+import http.server
+import mmap
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from now_playing import IcyReader
+from stream_resolver import open_stream
+
+# tmpfs keeps the constant rewrites off the SD card
+TIMESHIFT_PATH = '/dev/shm/radio-timeshift.buf' if os.path.isdir('/dev/shm') else '/tmp/radio-timeshift.buf'
+MAX_BITRATE = 320000  # Sizes the buffer so `minutes` holds even the highest-bitrate stations
+LIVE_LEAD_BYTES = 16 * 1024  # Handed to VLC straight away when it joins live
+CHUNK_BYTES = 16 * 1024
+
+
+class RingBuffer:
+    """Fixed-size byte ring in a memory-mapped file, addressed by absolute offsets.
+
+    `written` counts every byte ever appended; the last `size` of them are
+    readable. A coarse time index (one entry per second) maps wall time to
+    offsets so callers can seek by seconds whatever the stream bitrate.
+    """
+
+    def __init__(self, path, size):
+        self.size = size
+        self.written = 0
+        self.closed = False
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+            # The mapping keeps the file alive; unlinking it means a crash leaves nothing behind
+            # and the next session gets a fresh file at the same path
+            os.unlink(path)
+        self._times = deque()
+        self._offsets = deque()
+        self._condition = threading.Condition()
+
+    @property
+    def oldest(self):
+        return max(0, self.written - self.size)
+
+    def append(self, data):
+        with self._condition:
+            if self.closed:
+                return
+            if len(data) > self.size:
+                self.written += len(data) - self.size
+                data = data[-self.size:]
+            start = self.written % self.size
+            first = min(len(data), self.size - start)
+            self._map[start:start + first] = data[:first]
+            self._map[0:len(data) - first] = data[first:]
+            self.written += len(data)
+
+            now = time.monotonic()
+            if not self._times or now - self._times[-1] >= 1:
+                self._times.append(now)
+                self._offsets.append(self.written)
+            while self._offsets and self._offsets[0] < self.oldest:
+                self._times.popleft()
+                self._offsets.popleft()
+            self._condition.notify_all()
+
+    def read(self, offset, max_bytes, timeout=1.0):
+        """Return (offset, data) from offset, skipping forward if it was overwritten; data is b'' on timeout."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.closed or self.written > offset, timeout)
+            if self.closed:
+                raise EOFError('timeshift buffer closed')
+            offset = max(offset, self.oldest)
+            length = min(max_bytes, self.written - offset)
+            if length <= 0:
+                return offset, b''
+            start = offset % self.size
+            first = min(length, self.size - start)
+            data = self._map[start:start + first] + self._map[0:length - first]
+            return offset, data
+
+    def time_at(self, offset):
+        """Approximate wall time (monotonic) at which offset was ingested."""
+        with self._condition:
+            if not self._offsets:
+                return time.monotonic()
+            index = min(bisect.bisect_left(self._offsets, offset), len(self._offsets) - 1)
+            return self._times[index]
+
+    def offset_at(self, when):
+        """Offset ingested at about `when`, clamped to what is still buffered."""
+        with self._condition:
+            index = bisect.bisect_right(self._times, when) - 1
+            offset = self._offsets[index] if index >= 0 else self.oldest
+            return max(offset, self.oldest)
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            self._map.close()
+
+
+class TimeshiftSession:
+    """Reads one station into a RingBuffer and serves it to VLC over local HTTP.
+
+    The upstream connection belongs to the ingest thread, not to the player,
+    so pausing or seeking the player never reconnects to the station. VLC
+    opens live_url() to follow the live edge or url_at(offset) to play from
+    an earlier point. ICY titles are stripped on ingest and kept with the
+    offset they arrived at, and on_title(title) fires when playback reaches
+    one, so the title matches what is heard even while behind live.
+    """
+
+    def __init__(self, url, minutes=10, path=TIMESHIFT_PATH, max_bitrate=MAX_BITRATE, on_title=None):
+        self.url = url
+        self.on_title = on_title
+        self.buffer = RingBuffer(path, int(minutes * 60 * max_bitrate / 8))
+        self.content_type = 'audio/mpeg'
+        self.position = 0  # Last offset handed to the player
+        self.error = None
+        self.title = None  # Title at `position`
+        self._title_offsets = []
+        self._titles = []
+        self._title_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _TimeshiftHandler)
+        self._server.daemon_threads = True
+        self._server.session = self
+        threading.Thread(target=self._server.serve_forever, name='timeshift-http', daemon=True).start()
+        threading.Thread(target=self._ingest, name='timeshift-ingest', daemon=True).start()
+
+    def live_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/live"
+
+    def url_at(self, offset):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/at/{offset}"
+
+    def delay(self):
+        """Seconds the player is behind the live edge."""
+        if self.position >= self.buffer.written:
+            return 0
+        return max(0, time.monotonic() - self.buffer.time_at(self.position))
+
+    def offset_back(self, seconds):
+        """Offset `seconds` earlier than what the player is playing now."""
+        return self.buffer.offset_at(self.buffer.time_at(self.position) - seconds)
+
+    def advance(self, offset):
+        """Record that the player has been handed everything before offset."""
+        self.position = offset
+        with self._title_lock:
+            index = bisect.bisect_right(self._title_offsets, offset) - 1
+            title = self._titles[index] if index >= 0 else None
+            if title == self.title:
+                return
+            self.title = title
+        if title and self.on_title:
+            self.on_title(title)
+
+    def _add_title(self, title):
+        with self._title_lock:
+            self._title_offsets.append(self.buffer.written)
+            self._titles.append(title)
+            # Keep one title from before the oldest buffered byte for a jump all the way back
+            while len(self._title_offsets) > 1 and self._title_offsets[1] <= self.buffer.oldest:
+                del self._title_offsets[0], self._titles[0]
+
+    def close(self):
+        self._stop_event.set()
+        self._server.shutdown()
+        self._server.server_close()
+        self.buffer.close()
+
+    def _ingest(self):
+        attempts = 0
+        while not self._stop_event.is_set():
+            try:
+                # open_stream also copes with SHOUTcast v1 "ICY 200 OK" servers, which urllib rejects
+                response, connection = open_stream(self.url, timeout=10)
+                try:
+                    self.content_type = response.getheader('Content-Type', self.content_type)
+                    self.error = None
+                    attempts = 0
+                    reader = IcyReader(response, int(response.getheader('icy-metaint') or 0), self._add_title)
+                    while not self._stop_event.is_set():
+                        chunk = reader.read1(CHUNK_BYTES)
+                        if not chunk:
+                            raise EOFError('stream ended')
+                        self.buffer.append(chunk)
+                finally:
+                    connection.close()
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                self.error = str(e)
+                delay = min(30, 2 ** attempts)
+                attempts += 1
+                print(f"Timeshift ingest of {self.url} failed ({e}), retrying in {delay}s")
+                self._stop_event.wait(delay)
+
+
+class _TimeshiftHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+    def setup(self):
+        super().setup()
+        # A small send buffer keeps `position` close to what VLC has actually read
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, CHUNK_BYTES)
+
+    def do_GET(self):
+        session = self.server.session
+        buffer = session.buffer
+        if self.path == '/live':
+            offset = max(buffer.oldest, buffer.written - LIVE_LEAD_BYTES)
+        elif self.path.startswith('/at/') and self.path[4:].isdigit():
+            offset = int(self.path[4:])
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', session.content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while True:
+                offset, data = buffer.read(offset, CHUNK_BYTES)
+                if data:
+                    self.wfile.write(data)
+                    offset += len(data)
+                    session.advance(offset)
+        except (EOFError, OSError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,144 @@
+import math
+import subprocess
+import threading
+import time
+
+try:
+    import alsaaudio
+except ImportError:  # pyalsaaudio is optional
+    alsaaudio = None
+
+MIN_DB = -60.0
+
+
+def _to_db(volume):
+    return MIN_DB if volume <= 0 else max(MIN_DB, 20 * math.log10(volume / 100))
+
+
+def _from_db(db):
+    return 0 if db <= MIN_DB else 100 * 10 ** (db / 20)
+
+
+def _linear(start, target, progress):
+    return start + (target - start) * progress
+
+
+def _logarithmic(start, target, progress):
+    # Even steps in decibels sound even to the ear
+    return _from_db(_linear(_to_db(start), _to_db(target), progress))
+
+
+CURVES = {'linear': _linear, 'log': _logarithmic}
+
+
+def alsa_mixer_setter(control='PCM'):
+    """Return a setter for an ALSA mixer control, or None if pyalsaaudio or the control is missing."""
+    if alsaaudio is None:
+        return None
+    try:
+        mixer = alsaaudio.Mixer(control)
+    except alsaaudio.ALSAAudioError as e:
+        print(f"ALSA mixer {control} not available: {e}")
+        return None
+    return mixer.setvolume
+
+
+def amixer_setter(control='PCM'):
+    """Return a setter that drives one long-lived `amixer -s` process instead of one process per step."""
+    process = None
+
+    def setter(volume):
+        nonlocal process
+        if process is None or process.poll() is not None:
+            process = subprocess.Popen(['amixer', '-q', '-s'], stdin=subprocess.PIPE, text=True)
+        process.stdin.write(f"set {control} {volume}%\n")
+        process.stdin.flush()
+
+    return setter
+
+
+def mixer_setter(control='PCM'):
+    """Prefer pyalsaaudio and fall back to a batched amixer process."""
+    return alsa_mixer_setter(control) or amixer_setter(control)
+
+
+class VolumeRamp:
+    def __init__(self, start, target, duration, curve):
+        self.start = start
+        self.target = target
+        self.duration = duration
+        self.curve = CURVES[curve]
+        self.started_at = time.monotonic()
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def value(self, now):
+        progress = 1.0 if self.duration <= 0 else min(1.0, (now - self.started_at) / self.duration)
+        return round(self.curve(self.start, self.target, progress)), progress >= 1.0
+
+    def finish(self, cancelled=False):
+        self.cancelled = cancelled
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until the ramp ends; returns True if it completed rather than being replaced."""
+        return self._done.wait(timeout) and not self.cancelled
+
+
+class VolumeController:
+    """Ramps a volume setter in-process on one timer thread.
+
+    Starting a new ramp (or setting the volume directly) cancels the running
+    one. ramp() returns a VolumeRamp that callers can wait() on when they need
+    the fade to finish first.
+    """
+
+    def __init__(self, setter, volume=100, interval=0.02):
+        self.setter = setter
+        self.volume = volume
+        self.interval = interval
+        self._ramp = None
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, name='volume-ramp', daemon=True).start()
+
+    def set(self, volume):
+        """Set the volume immediately, cancelling any ramp."""
+        with self._condition:
+            self._cancel_ramp()
+            self._apply(volume)
+
+    def ramp(self, target, duration=0.5, curve='log'):
+        """Fade from the current volume to target over duration seconds."""
+        with self._condition:
+            self._cancel_ramp()
+            ramp = self._ramp = VolumeRamp(self.volume, target, duration, curve)
+            self._condition.notify_all()
+            return ramp
+
+    def _cancel_ramp(self):
+        if self._ramp is not None:
+            self._ramp.finish(cancelled=True)
+            self._ramp = None
+
+    def _apply(self, volume):
+        volume = max(0, min(100, int(volume)))
+        if volume != self.volume:
+            self.volume = volume
+            try:
+                self.setter(volume)
+            except Exception as e:
+                print(f"Error setting volume: {e}")
+
+    def _run(self):
+        with self._condition:
+            while True:
+                self._condition.wait_for(lambda: self._ramp is not None)
+                ramp = self._ramp
+                value, finished = ramp.value(time.monotonic())
+                self._apply(value)
+                if finished:
+                    self._ramp = None
+                    ramp.finish()
+                else:
+                    # Woken early when the ramp is replaced or cancelled
+                    self._condition.wait(self.interval)
@@ -0,0 +1,57 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import copy_current_request_context, jsonify, request
+
+try:
+    import waitress
+except ImportError:  # Falls back to Flask's threaded development server
+    waitress = None
+
+WEB_THREADS = 8
+SLOW_WORKERS = 2
+SLOW_QUEUE = 2  # Slow requests allowed to wait for a worker before new ones get 503
+
+_slow_executor = ThreadPoolExecutor(max_workers=SLOW_WORKERS, thread_name_prefix='slow-route')
+_slow_slots = threading.BoundedSemaphore(SLOW_WORKERS + SLOW_QUEUE)
+
+
+def slow_route(timeout=10, methods=None):
+    """Run a blocking (nmcli, iw, probe) handler on the bounded slow-route pool.
+
+    At most SLOW_WORKERS + SLOW_QUEUE such requests are in flight, so they can
+    never tie up all WEB_THREADS server threads and cheap routes like /ping keep
+    answering. Requests beyond that get 503, and a handler that takes longer
+    than timeout seconds gets 504 while it finishes in the background. With
+    methods set, other methods run directly on the server thread.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if methods and request.method not in methods:
+                return view(*args, **kwargs)
+            if not _slow_slots.acquire(blocking=False):
+                return jsonify({'success': False, 'error': 'Busy, try again shortly'}), 503
+            try:
+                future = _slow_executor.submit(copy_current_request_context(view), *args, **kwargs)
+            except BaseException:
+                _slow_slots.release()
+                raise
+            future.add_done_callback(lambda _: _slow_slots.release())
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                return jsonify({'success': False, 'error': 'Timed out'}), 504
+        return wrapper
+    return decorator
+
+
+def serve(app, host='0.0.0.0', port=5000, threads=WEB_THREADS):
+    """Serve app with waitress when it is installed, otherwise with Flask's threaded server."""
+    if waitress is not None:
+        print(f"Serving on http://{host}:{port} with waitress ({threads} threads)")
+        waitress.serve(app, host=host, port=port, threads=threads, channel_timeout=60)
+    else:
+        print("waitress not installed, using the Flask development server")
+        app.run(host=host, port=port, debug=False, threaded=True)
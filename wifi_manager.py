@@ -1,10 +1,23 @@
 import subprocess
+import threading
 import time
 from flask import Blueprint, jsonify, render_template, request
 import os
 import logging
+import json
 from datetime import datetime
 
+from config_writer import atomic_write
+from connectivity import get_prober
+from metrics import WIFI_CONNECT, timed_run
+
+from network_state import get_network_state, query_connection
+from wifi_scanner import WifiScanCache
+from web_server import slow_route
+
+SCAN_WAITERS = 2  # /wifi-scan?wait= requests allowed to hold a server thread at once
+SCAN_WAIT_SECONDS = 10
+
 class WiFiManager:
     def __init__(self, app=None):
         """Initialize the WiFi manager."""
@@ -15,6 +28,10 @@ class WiFiManager:
         self.ap_ssid = "InternetRadio"
         self.ap_password = "radiopassword"
         self.initial_connection_made = False
+        self.scan_cache = WifiScanCache(self.scan_wifi)
+        self.scan_waiters = threading.BoundedSemaphore(SCAN_WAITERS)
+        self.history_path = '/home/radio/internetRadio/wifi_history.json'
+        self.last_connection_timings = []
         
         # Setup logging
         self.setup_logging()
@@ -34,72 +51,180 @@ class WiFiManager:
         )
 
     def get_saved_networks(self):
-        """Get list of saved network connections."""
+        """Get list of saved Wi-Fi connections."""
         try:
-            result = subprocess.run(
-                ['nmcli', '-t', '-f', 'NAME', 'connection', 'show'],
+            result = timed_run(
+                ['nmcli', '-t', '-f', 'NAME,TYPE', 'connection', 'show'],
                 capture_output=True, text=True, check=True
             )
-            networks = [net for net in result.stdout.split('\n') if net]
+            networks = []
+            for line in result.stdout.split('\n'):
+                name, _, conn_type = line.rpartition(':')
+                if name and conn_type == '802-11-wireless':
+                    networks.append(name.replace('\\:', ':'))
             logging.info(f"Found saved networks: {networks}")
             return networks
         except Exception as e:
             logging.error(f"Error getting saved networks: {e}")
             return []
 
+    def get_saved_network_ssids(self, networks):
+        """Return {connection name: SSID}; a profile's name need not match the SSID it joins."""
+        ssids = {}
+        for network in networks:
+            try:
+                ssids[network], _ = query_connection(network)
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.error(f"Error reading SSID of {network}: {e}")
+                ssids[network] = network
+        return ssids
+
+    def get_visible_networks(self):
+        """Return {ssid: signal} from one scan."""
+        try:
+            result = timed_run(
+                ['nmcli', '-t', '-f', 'SSID,SIGNAL', 'device', 'wifi', 'list', '--rescan', 'auto'],
+                capture_output=True, text=True, check=True, timeout=15
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logging.error(f"Error listing visible networks: {e}")
+            return {}
+        visible = {}
+        for line in result.stdout.splitlines():
+            ssid, _, signal = line.rpartition(':')
+            ssid = ssid.replace('\\:', ':')
+            if ssid and signal.isdigit():
+                visible[ssid] = max(visible.get(ssid, 0), int(signal))
+        return visible
+
+    def load_connection_history(self):
+        """Load per-network connection history from disk."""
+        try:
+            with open(self.history_path, 'r') as history_file:
+                return json.load(history_file)
+        except (OSError, ValueError):
+            return {}
+
+    def record_connection_result(self, network, success):
+        """Remember whether connecting to network worked, for ranking at the next boot."""
+        history = self.load_connection_history()
+        entry = history.setdefault(network, {'last_success': 0, 'successes': 0, 'failures': 0})
+        if success:
+            entry['last_success'] = time.time()
+            entry['successes'] += 1
+        else:
+            entry['failures'] += 1
+        try:
+            atomic_write(self.history_path, json.dumps(history, indent=2))
+        except OSError as e:
+            logging.error(f"Error saving connection history: {e}")
+
+    def rank_saved_networks(self, networks, visible, history, ssids=None):
+        """Order saved networks: visible first, then most recently successful, then strongest signal.
+
+        networks are connection names; ssids maps them to the SSIDs that visible is keyed by.
+        """
+        ssids = ssids or {}
+
+        def score(network):
+            entry = history.get(network, {})
+            ssid = ssids.get(network, network)
+            return (
+                ssid in visible,
+                entry.get('last_success', 0),
+                visible.get(ssid, 0),
+                -entry.get('failures', 0)
+            )
+        return sorted(networks, key=score, reverse=True)
+
     def try_connect_saved_networks(self):
-        """Try to connect to saved networks only at startup."""
+        """Try to connect to saved networks only at startup, best candidates first."""
         if self.initial_connection_made:
             logging.info("Initial connection already made, skipping network scan")
             return True
-            
+
+        started = time.monotonic()
+        timings = self.last_connection_timings = []
+
+        def timed(step, func, *args):
+            step_started = time.monotonic()
+            result = func(*args)
+            timings.append((step, time.monotonic() - step_started))
+            return result
+
         max_attempts = 3
         attempt = 0
+        network_state = get_network_state()
         
         while attempt < max_attempts:
-            networks = self.get_saved_networks()
-            logging.info(f"Attempting to connect to saved networks (attempt {attempt + 1}/{max_attempts})")
-            
-            for network in networks:
-                if network != self.ap_ssid:  # Skip our own AP
-                    if self.connect_to_network(network):
-                        if self.check_internet():
-                            logging.info(f"Successfully connected to {network} with internet access")
-                            self.initial_connection_made = True
-                            return True
+            # NetworkManager may already have brought up a saved connection on its own
+            if network_state.connected and timed('internet check', self.wait_for_internet):
+                logging.info(f"Already connected to {network_state.ssid} with internet access")
+                self.record_connection_result(network_state.connection, True)
+                self.initial_connection_made = True
+                break
+
+            networks = [network for network in self.get_saved_networks() if network != self.ap_ssid]  # Skip our own AP
+            ssids = timed('read SSIDs', self.get_saved_network_ssids, networks)
+            visible = timed('scan', self.get_visible_networks)
+            history = self.load_connection_history()
+            candidates = self.rank_saved_networks(networks, visible, history, ssids)
+            if attempt < max_attempts - 1:
+                # Networks missing from the scan (e.g. hidden SSIDs) are only tried in the last round
+                candidates = [network for network in candidates if ssids[network] in visible] or candidates
+            logging.info(f"Attempting to connect to saved networks {candidates} (attempt {attempt + 1}/{max_attempts})")
+            
+            for network in candidates:
+                connected = timed(f'connect {network}', self.connect_to_network, network)
+                if connected and timed(f'internet check {network}', self.wait_for_internet):
+                    logging.info(f"Successfully connected to {network} with internet access")
+                    self.record_connection_result(network, True)
+                    self.initial_connection_made = True
+                    break
+                self.record_connection_result(network, False)
+            if self.initial_connection_made:
+                break
             attempt += 1
-            time.sleep(5)
+            # Give NetworkManager a moment to report a connection of its own instead of sleeping blindly
+            timed('wait for connection event', network_state.wait_for_connection, 5)
+
+        total = time.monotonic() - started
+        timings.append(('total', total))
+        logging.info("Saved network reconnection timings: " +
+                     ", ".join(f"{step}={seconds:.1f}s" for step, seconds in timings))
+        if self.initial_connection_made:
+            return True
         
         # Only enable AP mode if we haven't made an initial connection
-        if not self.initial_connection_made:
-            logging.info("No saved networks available or couldn't connect, enabling AP mode")
-            return self.enable_ap_mode()
-        return False
+        logging.info("No saved networks available or couldn't connect, enabling AP mode")
+        return self.enable_ap_mode()
 
-    def connect_to_network(self, ssid):
-        """Connect to a specific network."""
+    def connect_to_network(self, ssid, timeout=15):
+        """Connect to a specific network, waiting for NetworkManager to finish activating it."""
+        started = time.monotonic()
         try:
-            result = subprocess.run(
-                ['sudo', 'nmcli', 'connection', 'up', ssid],
-                capture_output=True, text=True, check=True
+            timed_run(
+                ['sudo', 'nmcli', '--wait', str(timeout), 'connection', 'up', ssid],
+                capture_output=True, text=True, check=True, timeout=timeout + 5
             )
             logging.info(f"Initial connection to {ssid} successful")
-            time.sleep(5)  # Wait for connection to stabilize
+            WIFI_CONNECT.observe(time.monotonic() - started, 'success')
             return True
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             logging.error(f"Failed to connect to {ssid}: {e}")
+            WIFI_CONNECT.observe(time.monotonic() - started, 'failure')
             return False
 
-    def check_internet(self):
-        """Check if we have internet connectivity."""
-        try:
-            subprocess.run(
-                ['ping', '-c', '1', '8.8.8.8'],
-                capture_output=True, check=True, timeout=5
-            )
+    def wait_for_internet(self, timeout=5):
+        """Wait for NetworkManager to report full connectivity, falling back to a direct check."""
+        if get_network_state().wait_for_connectivity(timeout):
             return True
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-            return False
+        # The connection just changed, so don't trust an older cached probe
+        return self.check_internet(max_age=0)
+
+    def check_internet(self, max_age=None):
+        """Check if we have internet connectivity (cached for a few seconds)."""
+        return get_prober().check(max_age)
 
     def enable_ap_mode(self):
         """Enable AP mode using NetworkManager."""
@@ -108,11 +233,11 @@ class WiFiManager:
             
         try:
             # Delete existing AP connection if it exists
-            subprocess.run(['sudo', 'nmcli', 'connection', 'delete', self.ap_ssid], 
+            timed_run(['sudo', 'nmcli', 'connection', 'delete', self.ap_ssid], 
                          capture_output=True, check=False)
             
             # Create new AP connection
-            subprocess.run([
+            timed_run([
                 'sudo', 'nmcli', 'connection', 'add',
                 'type', 'wifi',
                 'ifname', 'wlan0',
@@ -124,14 +249,14 @@ class WiFiManager:
             ], check=True)
             
             # Set password
-            subprocess.run([
+            timed_run([
                 'sudo', 'nmcli', 'connection', 'modify', self.ap_ssid,
                 'wifi-sec.key-mgmt', 'wpa-psk',
                 'wifi-sec.psk', self.ap_password
             ], check=True)
             
             # Activate the connection
-            subprocess.run(['sudo', 'nmcli', 'connection', 'up', self.ap_ssid], check=True)
+            timed_run(['sudo', 'nmcli', 'connection', 'up', self.ap_ssid], check=True)
             
             self.ap_mode = True
             logging.info("AP mode enabled successfully")
@@ -151,19 +276,19 @@ class WiFiManager:
                 # In AP mode, we need to do a special scan without disrupting the AP
                 try:
                     # Create a temporary interface for scanning
-                    subprocess.run(['sudo', 'iw', 'phy', 'phy0', 'interface', 'add', 'scan0', 'type', 'station'],
+                    timed_run(['sudo', 'iw', 'phy', 'phy0', 'interface', 'add', 'scan0', 'type', 'station'],
                                  check=True, capture_output=True)
                     time.sleep(1)
                     
                     # Bring the interface up
-                    subprocess.run(['sudo', 'ip', 'link', 'set', 'scan0', 'up'],
+                    timed_run(['sudo', 'ip', 'link', 'set', 'scan0', 'up'],
                                  check=True, capture_output=True)
                     time.sleep(1)
                     
                     # Scan using the temporary interface
                     for attempt in range(3):
                         try:
-                            result = subprocess.run(['sudo', 'iw', 'dev', 'scan0', 'scan'],
+                            result = timed_run(['sudo', 'iw', 'dev', 'scan0', 'scan'],
                                                   capture_output=True, text=True, check=True)
                             
                             for line in result.stdout.splitlines():
@@ -183,7 +308,7 @@ class WiFiManager:
                 finally:
                     # Clean up: remove temporary interface
                     try:
-                        subprocess.run(['sudo', 'iw', 'dev', 'scan0', 'del'],
+                        timed_run(['sudo', 'iw', 'dev', 'scan0', 'del'],
                                      check=False, capture_output=True)
                     except:
                         pass
@@ -191,7 +316,7 @@ class WiFiManager:
             else:
                 # Normal scanning mode when not in AP mode
                 for attempt in range(3):
-                    result = subprocess.run(['sudo', 'iwlist', 'wlan0', 'scan'],
+                    result = timed_run(['sudo', 'iwlist', 'wlan0', 'scan'],
                                           capture_output=True, text=True, check=True)
                     
                     for line in result.stdout.splitlines():
@@ -214,14 +339,32 @@ class WiFiManager:
             return []
 
     def handle_wifi_scan(self):
-        """Handle the /wifi-scan route."""
+        """Handle the /wifi-scan route.
+
+        Returns the cached scan immediately. ?refresh=1 starts a fresh background
+        scan (shared with any scan already running) and ?wait=<etag> blocks until
+        results newer than that etag are available, for at most SCAN_WAIT_SECONDS.
+        Only SCAN_WAITERS requests may wait at once so open tabs cannot take
+        every server thread; the others get the cached result with waited=False.
+        """
         try:
-            networks = self.scan_wifi()
-            return jsonify({
-                'status': 'complete',
-                'networks': networks,
-                'ap_mode': self.ap_mode  # Let the frontend know if we're in AP mode
-            })
+            wait_etag = request.args.get('wait')
+            if wait_etag:
+                if not self.scan_waiters.acquire(blocking=False):
+                    result = dict(self.scan_cache.get(), waited=False)
+                else:
+                    try:
+                        result = self.scan_cache.wait(wait_etag, timeout=SCAN_WAIT_SECONDS)
+                    finally:
+                        self.scan_waiters.release()
+            else:
+                result = self.scan_cache.get(refresh=request.args.get('refresh') == '1')
+
+            if result['scanned_at'] is None and result['scanning']:
+                status = 'scanning'
+            else:
+                status = 'complete'
+            return jsonify(dict(result, status=status, ap_mode=self.ap_mode))  # Let the frontend know if we're in AP mode
         except Exception as e:
             logging.error(f"Error in wifi scan handler: {str(e)}")
             return jsonify({
@@ -235,17 +378,17 @@ class WiFiManager:
             print(f"Attempting to connect to {ssid}")
             
             # Check current connection
-            current = subprocess.run(['iwgetid', '-r'], capture_output=True, text=True)
+            current = timed_run(['iwgetid', '-r'], capture_output=True, text=True)
             current_ssid = current.stdout.strip()
             print(f"Currently connected to: {current_ssid}")
             
             # First, forget the current connection if it exists
-            subprocess.run(['sudo', 'nmcli', 'connection', 'delete', ssid], 
+            timed_run(['sudo', 'nmcli', 'connection', 'delete', ssid], 
                           capture_output=True, check=False)  # Ignore errors if connection doesn't exist
             
             # Connect to the new network
             print(f"Connecting to {ssid}...")
-            result = subprocess.run([
+            result = timed_run([
                 'sudo', 'nmcli', 'device', 'wifi', 'connect', ssid,
                 'password', password, 'ifname', 'wlan0'
             ], capture_output=True, text=True)
@@ -258,7 +401,7 @@ class WiFiManager:
             time.sleep(5)
             
             # Verify new connection
-            new_connection = subprocess.run(['iwgetid', '-r'], capture_output=True, text=True)
+            new_connection = timed_run(['iwgetid', '-r'], capture_output=True, text=True)
             new_ssid = new_connection.stdout.strip()
             
             if new_ssid == ssid:
@@ -274,21 +417,21 @@ class WiFiManager:
         """Restart networking services in a more robust way."""
         try:
             # Stop services
-            subprocess.run(['sudo', 'systemctl', 'stop', 'wpa_supplicant'], check=True)
-            subprocess.run(['sudo', 'systemctl', 'stop', 'networking'], check=True)
+            timed_run(['sudo', 'systemctl', 'stop', 'wpa_supplicant'], check=True)
+            timed_run(['sudo', 'systemctl', 'stop', 'networking'], check=True)
             time.sleep(2)
             
             # Bring interface down
-            subprocess.run(['sudo', 'ifconfig', 'wlan0', 'down'], check=True)
+            timed_run(['sudo', 'ifconfig', 'wlan0', 'down'], check=True)
             time.sleep(1)
             
             # Bring interface up
-            subprocess.run(['sudo', 'ifconfig', 'wlan0', 'up'], check=True)
+            timed_run(['sudo', 'ifconfig', 'wlan0', 'up'], check=True)
             time.sleep(1)
             
             # Start services
-            subprocess.run(['sudo', 'systemctl', 'start', 'wpa_supplicant'], check=True)
-            subprocess.run(['sudo', 'systemctl', 'start', 'networking'], check=True)
+            timed_run(['sudo', 'systemctl', 'start', 'wpa_supplicant'], check=True)
+            timed_run(['sudo', 'systemctl', 'start', 'networking'], check=True)
             
             return True
         except Exception as e:
@@ -320,7 +463,8 @@ class WiFiManager:
                         'message': message
                     }), 400
             else:
-                networks = self.scan_wifi()
+                # Render with the cached list; a stale cache is refreshed in the background
+                networks = self.scan_cache.get()['networks']
                 return render_template('wifi_settings.html', networks=networks)
                 
         except Exception as e:
@@ -334,20 +478,18 @@ class WiFiManager:
     def handle_wifi_status(self):
         """Handle the /wifi/status route."""
         try:
-            if self.ap_mode:
+            state = get_network_state().snapshot()
+            if self.ap_mode or state['ap_mode']:
                 return jsonify({
                     'connected': False,
                     'ap_mode': True,
-                    'ssid': self.ap_ssid
+                    'ssid': state['ssid'] or self.ap_ssid
                 })
             
-            current = subprocess.run(['iwgetid', '-r'], capture_output=True, text=True)
-            current_ssid = current.stdout.strip()
-            
             return jsonify({
-                'connected': bool(current_ssid),
+                'connected': state['connected'],
                 'ap_mode': False,
-                'ssid': current_ssid
+                'ssid': state['ssid'] or ''
             })
         except Exception as e:
             logging.error(f"Error getting WiFi status: {e}")
@@ -361,7 +503,7 @@ class WiFiManager:
         """Handle the reboot request."""
         try:
             logging.info("Reboot requested via web interface")
-            subprocess.run(['sudo', 'reboot'], check=True)
+            timed_run(['sudo', 'reboot'], check=True)
             return jsonify({'status': 'success'})
         except Exception as e:
             logging.error(f"Error rebooting: {e}")
@@ -370,6 +512,7 @@ class WiFiManager:
     def register_routes(self):
         """Register the WiFi routes."""
         @self.blueprint.route('/wifi-settings', methods=['GET', 'POST'])
+        @slow_route(timeout=45, methods=('POST',))
         def wifi_settings():
             return self.handle_wifi_settings()
             
@@ -386,10 +529,12 @@ class WiFiManager:
             return self.handle_ping()
             
         @self.blueprint.route('/reboot', methods=['POST'])
+        @slow_route(timeout=10)
         def reboot():
             return self.handle_reboot()
             
         @self.blueprint.route('/start-ap-test', methods=['POST'])
+        @slow_route(timeout=30)
         def start_ap_test():
             return jsonify({'success': self.start_ap_test_mode()})
 
@@ -406,7 +551,7 @@ class WiFiManager:
             os.makedirs(backup_dir)
             
             # Backup current connections
-            subprocess.run(f"sudo cp -r /etc/NetworkManager/system-connections/* {backup_dir}/", shell=True)
+            timed_run(f"sudo cp -r /etc/NetworkManager/system-connections/* {backup_dir}/", shell=True)
             
             # Store test mode info
             with open('/home/radio/internetRadio/ap_test_mode', 'w') as f:
@@ -414,12 +559,12 @@ class WiFiManager:
                 f.write(f"{end_time}\n{backup_dir}")
                 
             # Remove all connections
-            subprocess.run("sudo rm /etc/NetworkManager/system-connections/*", shell=True)
+            timed_run("sudo rm /etc/NetworkManager/system-connections/*", shell=True)
             
             logging.info(f"Starting AP test mode. Connections backed up to {backup_dir}")
             
             # Reboot to trigger AP mode
-            subprocess.run("sudo reboot", shell=True)
+            timed_run("sudo reboot", shell=True)
             
         except Exception as e:
             logging.error(f"Error starting AP test mode: {e}")
@@ -438,9 +583,9 @@ class WiFiManager:
                 if time.time() > end_time:
                     # Test mode expired, restore connections
                     logging.info("AP test mode expired, restoring connections")
-                    subprocess.run(f"sudo cp -r {backup_dir}/* /etc/NetworkManager/system-connections/", shell=True)
+                    timed_run(f"sudo cp -r {backup_dir}/* /etc/NetworkManager/system-connections/", shell=True)
                     os.remove('/home/radio/internetRadio/ap_test_mode')
-                    subprocess.run("sudo reboot", shell=True)
+                    timed_run("sudo reboot", shell=True)
                     return False
                 return True
         except Exception as e:
@@ -0,0 +1,82 @@
+import itertools
+import logging
+import threading
+import time
+
+from metrics import WIFI_SCAN
+
+
+class WifiScanCache:
+    """Runs Wi-Fi scans as background jobs and serves the last result immediately.
+
+    Only one scan runs at a time; callers that ask for fresh results while a
+    scan is in flight share that job. Each completed scan gets a new etag so
+    clients can wait for results newer than the ones they already have.
+    """
+
+    def __init__(self, scan_func, ttl=30):
+        self.scan_func = scan_func
+        self.ttl = ttl
+        self.networks = []
+        self.scanned_at = None
+        self.error = None
+        self._generation = 0
+        self._job_ids = itertools.count(1)
+        self._job_id = None
+        self._condition = threading.Condition()
+
+    @property
+    def etag(self):
+        return f"scan-{self._generation}"
+
+    def is_stale(self):
+        return self.scanned_at is None or time.time() - self.scanned_at > self.ttl
+
+    def get(self, refresh=False):
+        """Return the cached results, starting a background scan if they are stale or refresh is set."""
+        with self._condition:
+            if refresh or self.is_stale():
+                self._start_job()
+            return self._result()
+
+    def wait(self, etag, timeout=20):
+        """Block until results newer than etag exist or no scan is running, then return them."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.etag != etag or self._job_id is None, timeout)
+            return self._result()
+
+    def _result(self):
+        return {
+            'networks': list(self.networks),
+            'scanned_at': self.scanned_at,
+            'etag': self.etag,
+            'job_id': self._job_id,
+            'scanning': self._job_id is not None,
+            'error': self.error
+        }
+
+    def _start_job(self):
+        if self._job_id is not None:
+            return
+        self._job_id = next(self._job_ids)
+        threading.Thread(target=self._run_job, args=(self._job_id,), name='wifi-scan', daemon=True).start()
+
+    def _run_job(self, job_id):
+        started = time.monotonic()
+        error = None
+        try:
+            networks = self.scan_func()
+        except Exception as e:
+            logging.error(f"Background WiFi scan failed: {e}")
+            networks, error = None, str(e)
+
+        WIFI_SCAN.observe(time.monotonic() - started)
+        with self._condition:
+            if networks is not None:
+                self.networks = networks
+                self.scanned_at = time.time()
+                self._generation += 1
+            self.error = error
+            self._job_id = None
+            self._condition.notify_all()
+        logging.info(f"WiFi scan job {job_id} finished in {time.monotonic() - started:.1f}s")